@@ -0,0 +1,355 @@
+# -*- coding: utf-8 -*-
+"""
+    Check the share status classification against a table of every
+    visibility variant and time the compiled classifier.
+
+    $ python benchmarks/classify.py --repeat 20000
+    $ python benchmarks/classify.py "path/to/Takeout/Google+ stream/Posts"
+
+    The table runs with a German and a multi-language configuration. If a
+    posts folder is given, every post is classified by the classifier and
+    by the per-post rules it replaced and both results are compared.
+
+    The "shared" and "import" sections --statuses suggests for the posts
+    (or for visibility_posts) are pasted into the configuration, with
+    them all posts to communities and circles must be excluded.
+"""
+
+from __future__ import unicode_literals, print_function
+
+import argparse
+import copy
+import os
+import sys
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, ".."))
+import import_gplus_html  # noqa: E402
+from import_gplus_html import Visibility  # noqa: E402
+
+CORPUS = os.path.join(HERE, "visibility_posts")
+
+CONFIG = {"shared": {"public": "Geteilt mit: Öffentlich",
+                     "circles": "Geteilt mit: Meine Kreise",
+                     "extcircles": "Geteilt mit: Meine erweiterten Kreise",
+                     "com": "Shared to the community",
+                     "coll": "Shared to the collection",
+                     "event": "Shared to the event",
+                     "other": "Andere",
+                     },
+          "import": {"private": True,
+                     "circle_filter": ["circle1", "circle2"],
+                     "com": True,
+                     "com_filter": ["com1", "com2"],
+                     "event": True,
+                     },
+          }
+
+# a dump with posts from times the account used other languages
+MULTI = copy.deepcopy(CONFIG)
+MULTI["shared"].update({"public": ["Geteilt mit: Öffentlich", "Shared with: Public", "Partagé avec : Public"],
+                        "circles": ["Geteilt mit: Meine Kreise", "Shared with: Your circles"],
+                        "extcircles": ["Geteilt mit: Meine erweiterten Kreise",
+                                       "Shared with: Your circles, Extended circles"],
+                        "com": ["Shared to the community", "In der Community geteilt"],
+                        "coll": ["Shared to the collection", "In der Sammlung geteilt"],
+                        "event": ["Shared to the event", "In der Veranstaltung geteilt"],
+                        })
+
+LINK = "https://plus.google.com/+Someone/posts/abc"
+COMMUNITY = "./communities/123"
+COLLECTION = "./collection/456"
+EVENT = "./events/789"
+CIRCLE = "./circles/0"
+PROFILE = "./111222333"
+
+# configuration changes, name
+VARIANTS = {"default": {},
+            "no_private": {"private": False},
+            "no_com": {"com": False},
+            "no_event": {"event": False},
+            "no_filters": {"circle_filter": None, "com_filter": None},
+            }
+
+# config, variant, (vis, vis_href, vis_text), (kind, label), category, warning
+CASES = [
+    # general statuses, with and without the rest of the list
+    (CONFIG, "default", ("Geteilt mit: Öffentlich", None, None),
+     (Visibility.PUBLIC, "Geteilt mit: Öffentlich"), "Geteilt mit: Öffentlich", None),
+    (CONFIG, "default", ("Geteilt mit: Öffentlich, Jemand ", PROFILE, "Jemand"),
+     (Visibility.PUBLIC, "Geteilt mit: Öffentlich"), "Geteilt mit: Öffentlich", None),
+    (CONFIG, "default", ("Geteilt mit: Meine Kreise", None, None),
+     (Visibility.CIRCLES, "Geteilt mit: Meine Kreise"), "Geteilt mit: Meine Kreise", None),
+    (CONFIG, "default", ("Geteilt mit: Meine erweiterten Kreise ", None, None),
+     (Visibility.EXTCIRCLES, "Geteilt mit: Meine erweiterten Kreise"),
+     "Geteilt mit: Meine erweiterten Kreise", None),
+    (CONFIG, "no_private", ("Geteilt mit: Meine Kreise, Jemand", PROFILE, "Jemand"),
+     (Visibility.CIRCLES, "Geteilt mit: Meine Kreise"), "Geteilt mit: Meine Kreise", None),
+    # communities
+    (CONFIG, "default", ("Shared to the community ", COMMUNITY, "Nikola"),
+     (Visibility.COMMUNITY, "Nikola"), 'Shared to the community "Nikola"', None),
+    (CONFIG, "default", ("Shared to the community", COMMUNITY, ""),
+     (Visibility.COMMUNITY, "Deleted community"), 'Shared to the community "Deleted community"', None),
+    (CONFIG, "default", ("Shared to the community", COMMUNITY, "com1"),
+     (Visibility.COMMUNITY, "com1"), None, 'Community post to "com1" will be ignored: ' + LINK),
+    (CONFIG, "no_filters", ("Shared to the community", COMMUNITY, "com1"),
+     (Visibility.COMMUNITY, "com1"), 'Shared to the community "com1"', None),
+    (CONFIG, "no_com", ("Shared to the community", COMMUNITY, "Nikola"),
+     (Visibility.COMMUNITY, "Nikola"), None, "Community post will be ignored: " + LINK),
+    (CONFIG, "no_com", ("Shared to the community", COMMUNITY, ""),
+     (Visibility.COMMUNITY, "Deleted community"), None, "Community post will be ignored: "),
+    # collections
+    (CONFIG, "default", ("Shared to the collection", COLLECTION, "Photos"),
+     (Visibility.COLLECTION, "Photos"), 'Shared to the collection "Photos"', None),
+    (CONFIG, "no_private", ("Shared to the collection", COLLECTION, None),
+     (Visibility.COLLECTION, "Deleted collection"), 'Shared to the collection "Deleted collection"', None),
+    # events
+    (CONFIG, "default", ("Shared to the event", EVENT, "Party"),
+     (Visibility.EVENT, "Party"), 'Shared to the event "Party"', None),
+    (CONFIG, "default", ("Shared to the event", EVENT, ""),
+     (Visibility.EVENT, "Deleted event"), 'Shared to the event "Deleted event"', None),
+    (CONFIG, "no_event", ("Shared to the event", EVENT, "Party"),
+     (Visibility.EVENT, "Party"), None, "Post to event will be ignored: " + LINK),
+    # circles
+    (CONFIG, "default", ("Geteilt mit: Familie", CIRCLE, "Familie"),
+     (Visibility.CIRCLE, "Familie"), 'Shared to circle "Familie"', None),
+    (CONFIG, "default", ("Geteilt mit: circle1", CIRCLE, "circle1"),
+     (Visibility.CIRCLE, "circle1"), None, 'Post to circle "circle1" will be ignored: ' + LINK),
+    (CONFIG, "no_filters", ("Geteilt mit: circle1", CIRCLE, "circle1"),
+     (Visibility.CIRCLE, "circle1"), 'Shared to circle "circle1"', None),
+    (CONFIG, "no_private", ("Geteilt mit: Familie", CIRCLE, "Familie"),
+     (Visibility.CIRCLE, "Familie"), None, "Private post will be ignored: " + LINK),
+    (CONFIG, "default", ("Geteilt mit: ", CIRCLE, ""),
+     (Visibility.CIRCLE, "Deleted circle"), 'Shared to circle "Deleted circle"', None),
+    # persons and everything else
+    (CONFIG, "default", ("Geteilt mit: Jemand", PROFILE, "Jemand"),
+     (Visibility.OTHER, "Geteilt mit: Jemand"), "Andere", None),
+    (CONFIG, "default", ("Geteilt mit: ", PROFILE, ""),
+     (Visibility.OTHER, "Geteilt mit:"), "Andere", None),
+    (CONFIG, "default", ("Privat", None, None),
+     (Visibility.OTHER, "Privat"), "Andere", None),
+    (CONFIG, "default", ("", None, None),
+     (Visibility.OTHER, ""), "Andere", None),
+    (CONFIG, "no_private", ("Privat", None, None),
+     (Visibility.OTHER, "Privat"), None, "Private post will be ignored: " + LINK),
+    (CONFIG, "no_private", ("Geteilt mit: ", PROFILE, ""),
+     (Visibility.OTHER, "Geteilt mit:"), None, "Private post will be ignored: "),
+    # statuses of other languages
+    (MULTI, "default", ("Geteilt mit: Öffentlich", None, None),
+     (Visibility.PUBLIC, "Geteilt mit: Öffentlich"), "Geteilt mit: Öffentlich", None),
+    (MULTI, "default", ("Shared with: Public, Someone", PROFILE, "Someone"),
+     (Visibility.PUBLIC, "Shared with: Public"), "Shared with: Public", None),
+    (MULTI, "default", ("Partagé avec : Public", None, None),
+     (Visibility.PUBLIC, "Partagé avec : Public"), "Partagé avec : Public", None),
+    (MULTI, "default", ("Shared with: Your circles", None, None),
+     (Visibility.CIRCLES, "Shared with: Your circles"), "Shared with: Your circles", None),
+    # the longer status wins
+    (MULTI, "default", ("Shared with: Your circles, Extended circles", None, None),
+     (Visibility.EXTCIRCLES, "Shared with: Your circles"), "Shared with: Your circles", None),
+    (MULTI, "default", ("In der Community geteilt", COMMUNITY, "Nikola"),
+     (Visibility.COMMUNITY, "Nikola"), 'In der Community geteilt "Nikola"', None),
+    (MULTI, "default", ("In der Community geteilt", COMMUNITY, "com2"),
+     (Visibility.COMMUNITY, "com2"), None, 'Community post to "com2" will be ignored: ' + LINK),
+    (MULTI, "no_com", ("Shared to the community", COMMUNITY, "Nikola"),
+     (Visibility.COMMUNITY, "Nikola"), None, "Community post will be ignored: " + LINK),
+    (MULTI, "default", ("In der Sammlung geteilt", COLLECTION, ""),
+     (Visibility.COLLECTION, "Deleted collection"), 'In der Sammlung geteilt "Deleted collection"', None),
+    (MULTI, "no_event", ("In der Veranstaltung geteilt", EVENT, "Party"),
+     (Visibility.EVENT, "Party"), None, "Post to event will be ignored: " + LINK),
+    (MULTI, "default", ("Shared with: Family", CIRCLE, "Family"),
+     (Visibility.CIRCLE, "Family"), 'Shared to circle "Family"', None),
+    (MULTI, "default", ("Shared with: Someone", PROFILE, "Someone"),
+     (Visibility.OTHER, "Shared with: Someone"), "Andere", None),
+]
+
+
+# (vis_href, vis_text), classify_link result with any configuration
+LINK_CASES = [
+    ((None, None), (None, None)),
+    ((COMMUNITY, "Nikola"), (Visibility.COMMUNITY, "Nikola")),
+    ((COMMUNITY, ""), (Visibility.COMMUNITY, "Deleted community")),
+    ((COLLECTION, "Photos"), (Visibility.COLLECTION, "Photos")),
+    ((COLLECTION, None), (Visibility.COLLECTION, "Deleted collection")),
+    ((CIRCLE, "Familie"), (Visibility.CIRCLE, "Familie")),
+    ((CIRCLE, ""), (Visibility.CIRCLE, "Deleted circle")),
+    ((EVENT, "Party"), (Visibility.EVENT, "Party")),
+    ((EVENT, ""), (Visibility.EVENT, "Deleted event")),
+    ((PROFILE, "Jemand"), (None, "Jemand")),
+    ((PROFILE, ""), (None, "Deleted profile")),
+]
+
+
+def configured(config, variant):
+    config = copy.deepcopy(config)
+    config["import"].update(VARIANTS[variant])
+    return config
+
+
+def header(vis, vis_href, vis_text):
+    return {"link": LINK, "vis": vis, "vis_href": vis_href, "vis_text": vis_text}
+
+
+def legacy_classify(post, config):
+    """
+        The rules before the classifier: config lookups and substring tests
+        for every post. Deleted circles are named like classify_link does.
+    """
+    post_link = post["link"]
+    vis_href = post["vis_href"]
+    vis_text = post["vis_text"]
+    if vis_href is not None and not vis_text:
+        if "communities" in vis_href:
+            vis_text = "Deleted community"
+        elif "collection" in vis_href:
+            vis_text = "Deleted collection"
+        elif "circle" in vis_href:
+            vis_text = "Deleted circle"
+        elif "event" in vis_href:
+            vis_text = "Deleted event"
+        else:
+            vis_text = "Deleted profile"
+        post_link = ""
+    vis = post["vis"].rstrip()
+    if (vis.startswith(config["shared"]["public"]) or
+            vis.startswith(config["shared"]["circles"]) or
+            vis.startswith(config["shared"]["extcircles"])):
+        return vis.split(",")[0], []
+    elif vis in config["shared"]["com"]:
+        if not config["import"]["com"]:
+            return None, [("warning", "Community post will be ignored: {}".format(post_link))]
+        elif config["import"]["com_filter"] and vis_text in config["import"]["com_filter"]:
+            return None, [("warning", "Community post to \"{}\" will be ignored: {}".format(vis_text, post_link))]
+        return "{} \"{}\"".format(vis, vis_text), []
+    elif vis in config["shared"]["coll"]:
+        return "{} \"{}\"".format(vis, vis_text), []
+    elif vis in config["shared"]["event"]:
+        if not config["import"]["event"]:
+            return None, [("warning", "Post to event will be ignored: {}".format(post_link))]
+        return "{} \"{}\"".format(vis, vis_text), []
+    elif vis_href is not None and "circles" in vis_href:
+        if not config["import"]["private"]:
+            return None, [("warning", "Private post will be ignored: {}".format(post_link))]
+        elif config["import"]["circle_filter"] and vis_text in config["import"]["circle_filter"]:
+            return None, [("warning", "Post to circle \"{}\" will be ignored: {}".format(vis_text, post_link))]
+        return "Shared to circle \"{}\"".format(vis_text), []
+    if not config["import"]["private"]:
+        return None, [("warning", "Private post will be ignored: {}".format(post_link))]
+    return config["shared"]["other"], []
+
+
+def check_table():
+    """Classify the table, return the number of failed cases."""
+    failures = 0
+    for config, variant, fields, visibility, category, warning in CASES:
+        classifier = import_gplus_html.VisibilityClassifier(configured(config, variant))
+        post = header(*fields)
+        expected = (visibility, (category, [("warning", warning)] if warning else []))
+        result = (classifier.classify(post), classifier.category(post))
+        # the second time from the results by share status
+        cached = (classifier.classify(post), classifier.category(post))
+        if result != expected or cached != expected:
+            failures += 1
+            print("FAIL {} {!r}:\n  expected {!r}\n  got      {!r}\n  cached   {!r}".format(
+                variant, fields, expected, result, cached))
+    # the links are classified the same whatever the statuses are
+    for config in (CONFIG, MULTI):
+        classifier = import_gplus_html.VisibilityClassifier(config)
+        for fields, expected in LINK_CASES:
+            result = classifier.classify_link(header("Unbekannt", *fields))
+            if result != expected:
+                failures += 1
+                print("FAIL link {!r}:\n  expected {!r}\n  got      {!r}".format(fields, expected, result))
+    print("{} cases, {} failures".format(len(CASES) + 2 * len(LINK_CASES), failures))
+    return failures
+
+
+def check_posts(path, config):
+    """Compare classifier and legacy rules on the posts of a dump, return the mismatches."""
+    classifier = import_gplus_html.VisibilityClassifier(config)
+    names = sorted(f for f in os.listdir(path) if f.endswith(".html"))
+    mismatches = 0
+    for name in names:
+        post = import_gplus_html.read_header(os.path.join(path, name))
+        a = classifier.category(post)
+        b = legacy_classify(post, config)
+        if a != b:
+            mismatches += 1
+            print("{}: classifier {!r}, legacy {!r}".format(name, a, b))
+    print("{} posts, {} mismatches".format(len(names), mismatches))
+    return [import_gplus_html.read_header(os.path.join(path, n)) for n in names], mismatches
+
+
+def check_suggestion(path, config):
+    """
+        Replace the "shared" and "import" sections by the ones --statuses
+        suggests for the posts and check that the filters exclude every
+        post to a community or circle. Returns the number of failures.
+    """
+    import yaml
+    classifier = import_gplus_html.VisibilityClassifier(config)
+    report = import_gplus_html.StatusReport(config["shared"], config["import"])
+    headers = []
+    for name in sorted(f for f in os.listdir(path) if f.endswith(".html")):
+        header, size, media = import_gplus_html.scan_post(os.path.join(path, name))
+        report.add(header, size, media, classifier.category(header)[0],
+                   classifier.classify(header)[0], classifier.classify_link(header))
+        headers.append(header)
+    # as pasted from the YAML output
+    suggested = yaml.safe_load(yaml.safe_dump(report.summary(), allow_unicode=True))
+    pasted = dict(config, shared=suggested["shared"])
+    pasted["import"] = suggested["import"]
+    classifier = import_gplus_html.VisibilityClassifier(pasted)
+    failures = 0
+    for header in headers:
+        kind, label = classifier.classify(header)
+        category, _ = classifier.category(header)
+        if kind in (Visibility.COMMUNITY, Visibility.CIRCLE) and category is not None:
+            failures += 1
+            print("FAIL {}: {} {!r} not excluded by the suggested filters".format(
+                header["name"], kind.name, label))
+    print("{} posts, suggested filters: {} failures".format(len(headers), failures))
+    return failures
+
+
+def timeit(func, posts, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for post in posts:
+            func(post)
+    return (time.perf_counter() - start) / (repeat * len(posts))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("posts", nargs="?", help="folder with the post HTML files")
+    parser.add_argument("--config", help="config.yaml for the posts (default: the table's)")
+    parser.add_argument("--repeat", type=int, default=2000)
+    args = parser.parse_args()
+
+    failures = check_table()
+    config = configured(CONFIG, "default")
+    if args.config:
+        import yaml
+        with open(args.config) as f:
+            config = yaml.safe_load(f)
+    failures += check_suggestion(args.posts or CORPUS, config)
+    if args.posts:
+        posts, mismatches = check_posts(args.posts, config)
+        failures += mismatches
+    else:
+        posts = [header(*fields) for cfg, _, fields, _, _, _ in CASES if cfg is CONFIG]
+
+    build = timeit(lambda _: import_gplus_html.VisibilityClassifier(config), [None], 1000)
+    classifier = import_gplus_html.VisibilityClassifier(config)
+    legacy = timeit(lambda post: legacy_classify(post, config), posts, args.repeat)
+    compiled = timeit(classifier.category, posts, args.repeat)
+    kinds = timeit(classifier.classify, posts, args.repeat)
+    print("build    {:8.2f} µs (once per run)".format(build * 1e6))
+    for label, seconds in (("legacy", legacy), ("compiled", compiled), ("classify", kinds)):
+        print("{:<8} {:8.3f} µs/post  {:5.2f}x".format(label, seconds * 1e6, legacy / seconds))
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
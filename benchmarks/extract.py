@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+"""
+    Compare the per-post extraction time of the single-pass extractor with
+    the former full soup + repeated find/find_all path.
+
+    $ python benchmarks/extract.py "path/to/Takeout/Google+ stream/Posts"
+"""
+
+from __future__ import unicode_literals, print_function
+
+import argparse
+import os
+import sys
+import time
+
+import bs4
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+import import_gplus_html  # noqa: E402
+
+
+def legacy_extract(path, name):
+    """Extraction as done by import_posts before the single-pass engine."""
+    with open(os.path.join(path, name)) as f:
+        soup = bs4.BeautifulSoup(f, "html.parser")
+    title = str(soup.title.string)
+    post_date = soup.find_all("a")[1].text
+    post_link = soup.find_all("a")[1].get("href")
+    post_text = soup.find("div", "main-content")
+    link_embed = soup.find("a", "link-embed")
+    media_link = soup.find_all("a", "media-link")
+    album = soup.find("div", "album")
+    video = soup.find("div", "video-placeholder")
+    visibility = soup.find("div", "visibility")
+    vis_link = soup.find("div", "visibility").find("a")
+    activity = soup.find("div", "post-activity")
+    comments = soup.find("div", "comments")
+    plusses = len(activity.find_all("a")) if activity else None
+    comment_count = len(comments.find_all("div", "comment")) if comments else None
+    return [str(part) for part in (title, post_date, post_link, post_text,
+                                   link_embed, media_link, album, video,
+                                   visibility, vis_link, activity, comments,
+                                   plusses, comment_count)]
+
+
+def timed(func, names):
+    start = time.perf_counter()
+    for name in names:
+        func(name)
+    return (time.perf_counter() - start) / len(names)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("posts", help="folder with the post HTML files")
+    parser.add_argument("--limit", type=int, default=0, help="only use the N largest posts")
+    args = parser.parse_args()
+
+    names = sorted((f for f in os.listdir(args.posts) if f.endswith(".html")),
+                   key=lambda f: os.path.getsize(os.path.join(args.posts, f)),
+                   reverse=True)
+    if args.limit:
+        names = names[:args.limit]
+
+    results = [("legacy", timed(lambda n: legacy_extract(args.posts, n), names))]
+    for backend in ("html.parser", "lxml"):
+        try:
+            bs4.BeautifulSoup("", backend)
+        except bs4.FeatureNotFound:
+            continue
+        results.append(("single-pass/{}".format(backend),
+                        timed(lambda n: import_gplus_html.extract_post(os.path.join(args.posts, n), backend),
+                              names)))
+
+    base = results[0][1]
+    print("{} posts".format(len(names)))
+    for label, per_post in results:
+        print("{:<24} {:8.2f} ms/post  {:5.2f}x".format(label, per_post * 1000, base / per_post))
+
+
+if __name__ == "__main__":
+    main()
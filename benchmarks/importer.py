@@ -0,0 +1,169 @@
+# -*- coding: utf-8 -*-
+"""
+    Time the phases of an import of a synthetic (or a given) Takeout dump
+    and write the results as JSON to compare commits.
+
+    $ python benchmarks/importer.py --posts 2000 --jobs 4 -o results.json
+
+    Each phase starts without cached posts so the numbers don't depend on
+    the order of the phases. Peak RSS is the maximum resident set size of
+    the process up to the end of the phase (Linux: KiB), worker processes
+    are reported separately.
+"""
+
+from __future__ import unicode_literals, print_function
+
+import argparse
+import contextlib
+import io
+import json
+import logging
+import os
+import platform
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import yaml
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, ".."))
+sys.path.insert(0, HERE)
+import import_gplus_html  # noqa: E402
+import takeout  # noqa: E402
+
+
+def peak_rss():
+    return (resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+            resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+
+
+def commit():
+    try:
+        return subprocess.check_output(["git", "describe", "--always", "--dirty"],
+                                       cwd=HERE, stderr=subprocess.DEVNULL,
+                                       universal_newlines=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(dump, work, config, jobs, watermark=False):
+    """Run the import phases in the order of the command, return the timings."""
+    cmd = import_gplus_html.CommandImportGplus()
+    cmd.config = config
+    cmd.output_folder = os.path.join(work, "site")
+    cmd.manifest_file = os.path.join(cmd.output_folder, import_gplus_html.MANIFEST)
+    cmd.manifest = import_gplus_html.new_manifest()
+    cmd.report = import_gplus_html.RunReport()
+    cmd.takeout = import_gplus_html.Takeout([dump])
+    sources = cmd.takeout.posts(config["gto"]["stream"], config["gto"]["posts"])
+    parser = config["import"].get("parser", "html.parser")
+    os.makedirs(cmd.output_folder)
+
+    def fresh_cache(name):
+        cmd.cache = import_gplus_html.PostCache(os.path.join(work, name), parser)
+
+    def populate_context():
+        post, _ = next(cmd.load_posts(list(sources.values())[:1]))
+        cmd.populate_context(post, config)
+
+    phases = [("analyze_share", lambda: cmd.analyze_share(sources, jobs)),
+              ("populate_context", populate_context),
+              ("import_posts", lambda: cmd.import_posts(sources, config, jobs)),
+              ("prepare_media", lambda: cmd.prepare_media(cmd.takeout,
+                                                          config["image"].get("media", "copy"),
+                                                          config["image"].get("dedupe", False),
+                                                          config["image"].get("dedupe_links", False))),
+              ("watermark_media", lambda: cmd.watermark_media(cmd.output_folder,
+                                                              config["image"]["watermark_text"],
+                                                              config["image"].get("watermark_backend", "pillow"),
+                                                              jobs)),
+              ]
+    if not watermark:
+        phases.pop()
+    results = {}
+    for name, phase in phases:
+        fresh_cache(name + ".sqlite")
+        start = time.perf_counter()
+        # the share report is not of interest here
+        with contextlib.redirect_stdout(io.StringIO()):
+            phase()
+        seconds = time.perf_counter() - start
+        cmd.cache.close()
+        rss, children_rss = peak_rss()
+        results[name] = {"seconds": round(seconds, 4),
+                         "posts_per_sec": round(len(sources) / seconds, 1) if seconds else None,
+                         "peak_rss_kb": rss,
+                         "children_peak_rss_kb": children_rss,
+                         }
+    return len(sources), results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--dump", help="benchmark this Takeout folder instead of a generated one")
+    parser.add_argument("--config", default=os.path.join(HERE, "..", "config.yaml"))
+    parser.add_argument("--posts", type=int, default=1000)
+    parser.add_argument("--comments", type=int, default=5, help="max. comments per post")
+    parser.add_argument("--plusses", type=int, default=5, help="max. +1s per post")
+    parser.add_argument("--unlinked", type=int, default=0, help="photos not linked by any post")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("-j", "--jobs", type=int, default=1)
+    parser.add_argument("--watermark", action="store_true", help="include watermark_media")
+    parser.add_argument("--keep", action="store_true", help="keep the working folder")
+    parser.add_argument("-v", "--verbose", action="store_true", help="show the import log")
+    parser.add_argument("-o", "--output", help="write the results to this file")
+    args = parser.parse_args()
+    with open(args.config) as f:
+        config = yaml.safe_load(f)
+    if not args.verbose:
+        import_gplus_html.LOGGER.setLevel(logging.ERROR)
+
+    work = tempfile.mkdtemp(prefix="import_gplus_bench_")
+    try:
+        dump = args.dump
+        start = time.perf_counter()
+        if dump is None:
+            dump = takeout.generate(os.path.join(work, "dump"), config,
+                                    posts=args.posts,
+                                    comments=args.comments,
+                                    plusses=args.plusses,
+                                    unlinked=args.unlinked,
+                                    seed=args.seed,
+                                    )
+        generated = time.perf_counter() - start
+        posts, phases = run(dump, work, config, args.jobs, args.watermark)
+    finally:
+        if args.keep:
+            print("Working folder: {}".format(work), file=sys.stderr)
+        else:
+            shutil.rmtree(work, ignore_errors=True)
+
+    result = {"commit": commit(),
+              "python": platform.python_version(),
+              "platform": platform.platform(),
+              "jobs": args.jobs,
+              "dump": args.dump or {"posts": args.posts,
+                                    "comments": args.comments,
+                                    "plusses": args.plusses,
+                                    "unlinked": args.unlinked,
+                                    "seed": args.seed,
+                                    "seconds": round(generated, 4),
+                                    },
+              "posts": posts,
+              "phases": phases,
+              "total_seconds": round(sum(p["seconds"] for p in phases.values()), 4),
+              }
+    text = json.dumps(result, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
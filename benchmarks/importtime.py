@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*-
+"""
+    Measure what loading the plugin module adds to every nikola call and
+    check that the modules only needed for an import are not loaded.
+
+    $ python benchmarks/importtime.py --repeat 5
+
+    The Nikola modules the plugin builds on are imported first because
+    Nikola has loaded them anyway when it loads the plugin.
+"""
+
+from __future__ import unicode_literals, print_function
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+PRELUDE = ("nikola.plugin_categories", "nikola.utils", "nikola.plugins.basic_import")
+# modules that must not be loaded with the plugin
+HEAVY = ("bs4", "PIL", "yaml", "sqlite3", "zipfile", "subprocess", "shutil",
+         "concurrent.futures", "multiprocessing", "cProfile", "pstats",
+         "nikola.plugins.command.init")
+
+CODE = """
+import sys
+sys.path.insert(0, {repo!r})
+{prelude}
+before = set(sys.modules)
+sys.stderr.write("--plugin--\\n")
+import import_gplus_html
+print(json.dumps(sorted(set(sys.modules) - before)))
+"""
+
+
+def measure():
+    """Cumulative import time (µs) of the plugin and the modules it loaded."""
+    code = CODE.format(repo=os.path.join(HERE, ".."),
+                       prelude="\n".join("import " + m for m in PRELUDE + ("json",)))
+    proc = subprocess.run([sys.executable, "-X", "importtime", "-c", code],
+                          stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                          universal_newlines=True, check=True)
+    log = proc.stderr.split("--plugin--\n", 1)[1]
+    cumulative = None
+    for line in log.splitlines():
+        fields = [f.strip() for f in line.split("|")]
+        if len(fields) == 3 and fields[2] == "import_gplus_html":
+            cumulative = int(fields[1])
+    return cumulative, json.loads(proc.stdout)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    times = []
+    for _ in range(args.repeat):
+        cumulative, loaded = measure()
+        times.append(cumulative)
+    heavy = [m for m in loaded if m.split(".")[0] in HEAVY or m in HEAVY]
+    print("import_gplus_html: {:.1f} ms (median of {}, min {:.1f} ms)".format(
+        statistics.median(times) / 1000, len(times), min(times) / 1000))
+    print("{} modules loaded with the plugin".format(len(loaded)))
+    if heavy:
+        print("loaded but only needed for an import: {}".format(", ".join(heavy)))
+    return 1 if heavy else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
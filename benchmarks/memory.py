@@ -0,0 +1,57 @@
+# -*- coding: utf-8 -*-
+"""
+    Check that the peak memory of an import doesn't grow with the number
+    of posts: import generated dumps of increasing size in fresh processes
+    and compare their peak RSS.
+
+    $ python benchmarks/memory.py --posts 500 --factor 4 --jobs 2
+"""
+
+from __future__ import unicode_literals, print_function
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def peak(posts, args):
+    """Peak RSS (KiB) of the parent and the workers while importing."""
+    out = subprocess.check_output([sys.executable, os.path.join(HERE, "importer.py"),
+                                   "--posts", str(posts),
+                                   "--comments", str(args.comments),
+                                   "--jobs", str(args.jobs),
+                                   "--seed", str(args.seed),
+                                   ])
+    phases = json.loads(out.decode("utf-8"))["phases"]
+    return (max(p["peak_rss_kb"] for p in phases.values()),
+            max(p["children_peak_rss_kb"] for p in phases.values()))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--posts", type=int, default=500, help="posts of the smaller dump")
+    parser.add_argument("--factor", type=int, default=4, help="size of the larger dump")
+    parser.add_argument("--comments", type=int, default=60, help="max. comments per post")
+    parser.add_argument("-j", "--jobs", type=int, default=2)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--tolerance", type=float, default=0.1,
+                        help="allowed relative growth of the peak RSS")
+    args = parser.parse_args()
+
+    small = peak(args.posts, args)
+    large = peak(args.posts * args.factor, args)
+    failed = False
+    for label, a, b in (("parent", small[0], large[0]), ("workers", small[1], large[1])):
+        growth = (b - a) / a if a else 0.0
+        failed |= growth > args.tolerance
+        print("{:<8} {:>8} KiB ({} posts)  {:>8} KiB ({} posts)  {:+6.1%}".format(
+            label, a, args.posts, b, args.posts * args.factor, growth))
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
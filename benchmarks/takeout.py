@@ -0,0 +1,220 @@
+# -*- coding: utf-8 -*-
+"""
+    Write a synthetic Google+ Takeout tree for benchmarking the importer.
+
+    Folder names and share status strings are taken from the plugin's
+    config.yaml so the generated dump matches the configured language.
+
+    $ python benchmarks/takeout.py --posts 1000 --visibility com=5 path/to/dump
+"""
+
+from __future__ import unicode_literals, print_function
+
+import argparse
+import os
+import random
+import yaml
+from PIL import Image
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+POST = """<!DOCTYPE html>
+<html><head><meta charset="UTF-8"><link rel="stylesheet" type="text/css" href="../../style.css"><title>{title}</title></head>
+<body><div class="main"><div class="header"><a class="author" href="https://plus.google.com/{uid}">Anke K</a> - <span class="time"><a href="https://plus.google.com/{uid}/posts/{pid}">{date}</a></span><div class="visibility">{vis}</div></div>
+<div class="main-content">{text}</div>
+{attachment}{activity}{comments}</div></body></html>
+"""
+
+COMMENT = """<div class="comment"><div class="header"><a class="author" href="https://plus.google.com/{uid}">User {uid}</a> - <span class="time">{date}</span></div><div class="comment-content">{text}</div></div>"""
+
+# photo folders of the stream, by site language
+PHOTO_FOLDERS = {"de": ("Fotos", "Fotos von Beiträgen"),
+                 "en": ("Photos", "Photos of posts"),
+                 }
+
+# relative frequency of the share status of posts
+VISIBILITIES = {"public": 5,
+                "circles": 2,
+                "extcircles": 1,
+                "com": 2,
+                "deleted_com": 1,
+                "coll": 1,
+                "event": 1,
+                "circle": 1,
+                "profile": 1,
+                "other": 1,
+                }
+
+WORDS = ("lorem ipsum dolor sit amet consectetur adipiscing elit sed do "
+         "eiusmod tempor incididunt ut labore et dolore magna aliqua "
+         "Grüße Straße Bär").split()
+
+
+def sentence(rnd, n):
+    return " ".join(rnd.choice(WORDS) for _ in range(n))
+
+
+def image(path, rnd):
+    Image.new("RGB",
+              (rnd.randint(320, 800), rnd.randint(240, 600)),
+              tuple(rnd.randint(0, 255) for _ in range(3)),
+              ).save(path, "JPEG")
+
+
+def visibility(kind, config, rnd):
+    shared = config["shared"]
+    base = "https://plus.google.com"
+    if kind in ("public", "circles", "extcircles"):
+        return shared[kind]
+    if kind == "com":
+        name = rnd.choice(["com1", "com2", "Python", "Nikola"])
+        return "{} <a href=\"{}/communities/{}\">{}</a>".format(
+            shared["com"], base, rnd.randint(1, 99), name)
+    if kind == "deleted_com":
+        return "{} <a href=\"{}/communities/{}\"></a>".format(
+            shared["com"], base, rnd.randint(1, 99))
+    if kind == "coll":
+        return "{} <a href=\"{}/collection/{}\">Collection {}</a>".format(
+            shared["coll"], base, rnd.randint(1, 9), rnd.randint(1, 9))
+    if kind == "event":
+        return "{} <a href=\"{}/events/{}\">Party</a>".format(
+            shared["event"], base, rnd.randint(1, 99))
+    if kind == "circle":
+        return "{} <a href=\"{}/circles/{}\">{}</a>".format(
+            shared["public"].split(":")[0] + ":", base, rnd.randint(1, 9),
+            rnd.choice(["circle1", "circle2", "Familie", "Freunde"]))
+    if kind == "profile":
+        return "{} <a href=\"{}/{}\">Jane Doe</a>".format(
+            shared["public"].split(":")[0] + ":", base, rnd.randint(1, 9999))
+    # shared to a list of persons without link
+    return "{} Jane Doe, John Doe".format(shared["public"].split(":")[0] + ":")
+
+
+def generate(target, config, posts=100, comments=5, plusses=5, albums=0.1,
+             photos=0.3, videos=0.05, links=0.2, unlinked=0, visibilities=None,
+             seed=0):
+    """Write a fake Takeout tree below ``target`` and return its path."""
+    rnd = random.Random(seed)
+    visibilities = visibilities or VISIBILITIES
+    kinds = list(visibilities)
+    weights = [visibilities[k] for k in kinds]
+
+    takeout = os.path.join(target, "Takeout")
+    stream = os.path.join(takeout, config["gto"]["stream"])
+    post_dir = os.path.join(stream, config["gto"]["posts"])
+    photos_folder = PHOTO_FOLDERS.get(config["site"]["lang"], PHOTO_FOLDERS["en"])
+    photo_dir = os.path.join(stream, *photos_folder)
+    album_dir = os.path.join(takeout, "Google Fotos", "Album")
+    for d in (post_dir, photo_dir, album_dir, os.path.join(takeout, "+1")):
+        os.makedirs(d, exist_ok=True)
+
+    # photos of other Takeout sections no post links to
+    for i in range(unlinked):
+        image(os.path.join(album_dir, "unlinked_{:05d}.jpg".format(i)), rnd)
+
+    for i in range(posts):
+        date = "{}-{:02d}-{:02d} {:02d}:{:02d}:00+0100".format(
+            rnd.randint(2012, 2019), rnd.randint(1, 12), rnd.randint(1, 28),
+            rnd.randint(0, 23), rnd.randint(0, 59))
+        text = sentence(rnd, rnd.randint(5, 80))
+        title = "{}. {}".format(sentence(rnd, rnd.randint(2, 8)), text[:40])
+        attachment = ""
+        roll = rnd.random()
+        if roll < albums:
+            items = []
+            for j in range(rnd.randint(2, 6)):
+                img = "album_{}_{}.jpg".format(i, j)
+                image(os.path.join(album_dir, img), rnd)
+                items.append("<a class=\"media-link\" href=\"{0}\">"
+                             "<img class=\"media\" src=\"{0}\"></a>".format(img))
+            attachment = "<div class=\"album\">{}</div>\n".format("".join(items))
+        elif roll < albums + photos:
+            img = "IMG_{:05d}{}.jpg".format(i, "=w800" if i % 7 == 0 else "")
+            image(os.path.join(photo_dir, img), rnd)
+            attachment = ("<a class=\"media-link\" href=\"{0}\">"
+                          "<img class=\"media\" src=\"{0}\"><p>{1}</p></a>\n"
+                          ).format(img, text[:20])
+        elif roll < albums + photos + videos:
+            vid = "VID_{:05d}.mp4".format(i)
+            with open(os.path.join(photo_dir, vid), "wb") as f:
+                f.write(os.urandom(2048))
+            attachment = ("<div class=\"video-placeholder\">"
+                          "<a class=\"media-link\" href=\"{0}\">Video</a>"
+                          "</div>\n").format(vid)
+        elif roll < albums + photos + videos + links:
+            attachment = ("<a class=\"link-embed\" href=\"https://example.com/{}\">"
+                          "<div class=\"link-title\">{}</div></a>\n"
+                          ).format(i, sentence(rnd, 4))
+
+        activity = ""
+        n = rnd.randint(0, plusses)
+        if n:
+            activity = "<div class=\"post-activity\">+1'd by: {}</div>\n".format(
+                ", ".join("<a href=\"https://plus.google.com/{0}\">User {0}</a>".format(
+                    rnd.randint(1, 9999)) for _ in range(n)))
+
+        thread = ""
+        n = rnd.randint(0, comments)
+        if n:
+            thread = "<div class=\"comments\">{}</div>\n".format("".join(
+                COMMENT.format(uid=rnd.randint(1, 9999),
+                               date=date,
+                               text=sentence(rnd, rnd.randint(3, 60)),
+                               ) for _ in range(n)))
+
+        with open(os.path.join(post_dir, "{:05d}.html".format(i)),
+                  "w", encoding="utf-8") as f:
+            f.write(POST.format(title=title,
+                                uid="1000",
+                                pid="p{:05d}".format(i),
+                                date=date,
+                                vis=visibility(rnd.choices(kinds, weights)[0],
+                                               config, rnd),
+                                text=text,
+                                attachment=attachment,
+                                activity=activity,
+                                comments=thread,
+                                ))
+    return target
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("target", help="folder to write the dump into")
+    parser.add_argument("--config", default=os.path.join(HERE, "..", "config.yaml"))
+    parser.add_argument("--posts", type=int, default=100)
+    parser.add_argument("--comments", type=int, default=5, help="max. comments per post")
+    parser.add_argument("--plusses", type=int, default=5, help="max. +1s per post")
+    parser.add_argument("--albums", type=float, default=0.1, help="ratio of album posts")
+    parser.add_argument("--photos", type=float, default=0.3, help="ratio of photo posts")
+    parser.add_argument("--videos", type=float, default=0.05, help="ratio of video posts")
+    parser.add_argument("--links", type=float, default=0.2, help="ratio of link posts")
+    parser.add_argument("--unlinked", type=int, default=0, help="photos not linked by any post")
+    parser.add_argument("--visibility", action="append", default=[], metavar="KIND=WEIGHT",
+                        help="relative frequency of a share status ({})".format(", ".join(VISIBILITIES)))
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    with open(args.config) as f:
+        config = yaml.safe_load(f)
+    visibilities = dict(VISIBILITIES)
+    for option in args.visibility:
+        kind, weight = option.split("=")
+        if kind not in VISIBILITIES:
+            parser.error("unknown share status {}".format(kind))
+        visibilities[kind] = float(weight)
+    generate(args.target, config,
+             posts=args.posts,
+             comments=args.comments,
+             plusses=args.plusses,
+             albums=args.albums,
+             photos=args.photos,
+             videos=args.videos,
+             links=args.links,
+             unlinked=args.unlinked,
+             visibilities=visibilities,
+             seed=args.seed,
+             )
+
+
+if __name__ == "__main__":
+    main()
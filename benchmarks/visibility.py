@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+"""
+    Check that the header scanner classifies posts like a full parse and
+    compare the time both need.
+
+    $ python benchmarks/visibility.py
+    $ python benchmarks/visibility.py "path/to/Takeout/Google+ stream/Posts"
+
+    Without a folder the posts of visibility_posts are checked, one for
+    every kind of share status: entities, padded statuses, circles with
+    several recipients, deleted communities, collections, events and
+    profiles. Posts are classified with the given config.yaml and with
+    everything but public posts excluded.
+"""
+
+from __future__ import unicode_literals, print_function
+
+import argparse
+import copy
+import os
+import sys
+import time
+
+import bs4
+import yaml
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, ".."))
+import import_gplus_html  # noqa: E402
+
+CORPUS = os.path.join(HERE, "visibility_posts")
+
+
+def soup_header(path, name):
+    """Classification fields as read from a full soup."""
+    with open(os.path.join(path, name)) as f:
+        soup = bs4.BeautifulSoup(f, "html.parser")
+    visibility = soup.find("div", "visibility")
+    vis_link = visibility.find("a")
+    vis_text = None
+    if vis_link:
+        try:
+            vis_text = vis_link.contents[0]
+        except IndexError:
+            vis_text = ""
+    return {"name": name,
+            "link": soup.find_all("a")[1].get("href"),
+            "vis": str(visibility.contents[0]),
+            "vis_href": vis_link.get("href") if vis_link else None,
+            "vis_text": vis_text,
+            }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("posts", nargs="?", default=CORPUS, help="folder with the post HTML files")
+    parser.add_argument("--config", default=os.path.join(HERE, "..", "config.yaml"))
+    args = parser.parse_args()
+    with open(args.config) as f:
+        config = yaml.safe_load(f)
+
+    excluding = copy.deepcopy(config)
+    excluding["import"].update(private=False, com=False, event=False)
+    classifiers = [import_gplus_html.VisibilityClassifier(c) for c in (config, excluding)]
+    names = sorted(f for f in os.listdir(args.posts) if f.endswith(".html"))
+    timings = {"scanner": 0.0, "soup": 0.0}
+    mismatches = 0
+    for name in names:
+        start = time.perf_counter()
+        scanned = import_gplus_html.read_header(os.path.join(args.posts, name))
+        timings["scanner"] += time.perf_counter() - start
+        start = time.perf_counter()
+        parsed = soup_header(args.posts, name)
+        timings["soup"] += time.perf_counter() - start
+
+        a = [(c.classify(scanned), c.category(scanned)) for c in classifiers]
+        b = [(c.classify(parsed), c.category(parsed)) for c in classifiers]
+        if a != b:
+            mismatches += 1
+            print("{}: scanner {!r}, soup {!r}".format(name, a, b))
+
+    print("{} posts, {} mismatches".format(len(names), mismatches))
+    for label, total in sorted(timings.items()):
+        print("{:<8} {:8.3f} ms/post".format(label, total / len(names) * 1000))
+    return 1 if mismatches else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -2,25 +2,31 @@
 
 from __future__ import unicode_literals, print_function
 
+# Nikola loads this module on every invocation, so modules only needed
+# for an import (bs4, PIL, yaml, ...) are imported where they are used.
+import contextlib
+import copy
+import enum
+import functools
+import hashlib
+import heapq
+import html.parser
+import importlib.util
+import io
+import itertools
+import json
 import os
-import shlex
-import shutil
-import subprocess
+import posixpath
+import re
 import sys
-import yaml
-from collections import Counter
-from PIL import Image
-
-try:
-    import bs4
-except ModuleNotFoundError:
-    raise
+import time
+import urllib.parse
+from collections import Counter, deque, namedtuple
 
 from nikola.plugin_categories import Command
 from nikola import utils
 from nikola.utils import req_missing, get_logger
 from nikola.plugins.basic_import import ImportMixin
-from nikola.plugins.command.init import SAMPLE_CONF, prepare_config
 
 LOGGER = get_logger("import_gplus")
 
@@ -30,7 +36,7 @@ class CommandImportGplus(Command, ImportMixin):
 
     name = "import_gplus"
     needs_config = True
-    doc_usage = "[options] extracted_dump_file_folder"
+    doc_usage = "[options] extracted_dump_file_folder | takeout-*.zip"
     doc_purpose = "import a Google+ dump"
     cmd_options = ImportMixin.cmd_options + [
         {
@@ -40,81 +46,274 @@ class CommandImportGplus(Command, ImportMixin):
             "default": False,
             "type": bool,
             "help": "Show all post statuses to support you with configuration",
-        }
+        },
+        {
+            "name": "format",
+            "long": "format",
+            "default": "text",
+            "type": str,
+            "help": "Output format of --statuses: text, json or yaml",
+        },
+        {
+            "name": "jobs",
+            "long": "jobs",
+            "short": "j",
+            "default": 1,
+            "type": int,
+            "help": "Number of processes converting posts and images (0: one per CPU)",
+        },
+        {
+            "name": "force",
+            "long": "force",
+            "short": "f",
+            "default": False,
+            "type": bool,
+            "help": "Ignore the manifest of the last import and convert all posts",
+        },
+        {
+            "name": "since",
+            "long": "since",
+            "default": None,
+            "type": str,
+            "help": "Only import posts from this date on (YYYY[-MM[-DD]])",
+        },
+        {
+            "name": "until",
+            "long": "until",
+            "default": None,
+            "type": str,
+            "help": "Only import posts up to this date (YYYY[-MM[-DD]])",
+        },
+        {
+            "name": "sample",
+            "long": "sample",
+            "default": None,
+            "type": float,
+            "help": "Only import this ratio (0-1) of the posts, chosen by --seed",
+        },
+        {
+            "name": "seed",
+            "long": "seed",
+            "default": 0,
+            "type": int,
+            "help": "Seed of the --sample selection",
+        },
+        {
+            "name": "limit",
+            "long": "limit",
+            "default": None,
+            "type": int,
+            "help": "Only import the first N (selected) posts",
+        },
+        {
+            "name": "to_jsonl",
+            "long": "to-jsonl",
+            "default": None,
+            "type": str,
+            "help": "Extract the posts to a JSONL file and exit (nothing is imported)",
+        },
+        {
+            "name": "from_jsonl",
+            "long": "from-jsonl",
+            "default": None,
+            "type": str,
+            "help": "Import the posts of a JSONL file written by --to-jsonl",
+        },
+        {
+            "name": "profile",
+            "long": "profile",
+            "default": False,
+            "type": bool,
+            "help": "Profile the import with cProfile and save the statistics",
+        },
     ]
     def _execute(self, options, args):
+        if not options.get("profile"):
+            return self.import_dump(options, args)
+        import cProfile
+        import pstats
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            return self.import_dump(options, args)
+        finally:
+            profiler.disable()
+            profiler.dump_stats(PROFILE)
+            stats = io.StringIO()
+            pstats.Stats(profiler, stream=stats).sort_stats("cumulative").print_stats(25)
+            LOGGER.info("Profile written to {}, worker processes are not included.\n{}".format(
+                PROFILE, stats.getvalue()))
+
+    def import_dump(self, options, args):
         """
             Import Google+ dump
         """
 
-        if not args:
+        if not args and not options.get("from_jsonl"):
             print(self.help())
             return
         
-        options["foldername"] = args[0]
-        self.export_folder = os.path.join(options["foldername"], "Takeout")
+        # posts are read from the JSONL file instead of the dump, the
+        # dump is only needed for the media files then
+        self.takeout = None
+        if args:
+            options["foldername"] = args[0]
+            self.takeout = Takeout(args)
         self.output_folder = options["output_folder"]
         self.import_into_existing_site = False
         self.url_map = {}
 
-        with open(os.path.join("plugins",
-                                "import_gplus_html",
-                                "config.yaml")) as f:
-            self.config = yaml.load(f)
-
-        # path to post files
-        post_path = os.path.join(self.export_folder,
-                                 self.config["gto"]["stream"],
-                                 self.config["gto"]["posts"],
-                                )
-        
-        # collect all files
-        files = [f for f in os.listdir(os.path.join(post_path)) if os.path.isfile(os.path.join(post_path, f))]
+        plugin_folder = os.path.join("plugins", "import_gplus_html")
+        missing = [m for m in ("bs4", "PIL", "yaml") if importlib.util.find_spec(m) is None]
+        if missing:
+            req_missing(missing, "import Google+ dumps")
+        self.config = load_config(os.path.join(plugin_folder, "config.yaml"))
 
-        src_files = [f for f in files if f.endswith(".html")]
+        # collect all post files
+        if options.get("from_jsonl"):
+            src_files = jsonl_index(options["from_jsonl"])
+            if not src_files:
+                LOGGER.warning("No posts found in {}.".format(options["from_jsonl"]))
+                sys.exit(1)
+            LOGGER.info("{} extracted posts ready for import".format(len(src_files)))
+        else:
+            src_files = self.takeout.posts(self.config["gto"]["stream"],
+                                           self.config["gto"]["posts"],
+                                           )
         if len(src_files) == 0:
             LOGGER.warning("""No HTML files found. Possible reasons:
     1) you pointed to the wrong folder
     2) you selected the wrong file format
     3) there may be (spelling) errors in the configuration file""")
             sys.exit(1)
-        else:
+        elif not options.get("from_jsonl"):
             LOGGER.info("{} HTML formatted posts ready for import".format(len(src_files)))
+
+        # preview imports of a part of the posts
+        for option in ("since", "until"):
+            if options.get(option) and not DATE_RE.match(options[option]):
+                LOGGER.error("--{} expects a date like 2018, 2018-12 or 2018-12-31.".format(option))
+                sys.exit(1)
+        if options.get("sample") is not None and not 0 < options["sample"] <= 1:
+            LOGGER.error("--sample expects a ratio between 0 and 1.")
+            sys.exit(1)
+        # all posts of the dump, a preview keeps the other posts of the
+        # output folder
+        all_files = src_files
+        if any(options.get(o) is not None for o in ("since", "until", "sample", "limit")):
+            total = len(src_files)
+            src_files = select_posts(src_files,
+                                     since=options.get("since"),
+                                     until=options.get("until"),
+                                     sample=options.get("sample"),
+                                     seed=options.get("seed") or 0,
+                                     limit=options.get("limit"),
+                                     )
+            LOGGER.info("{} of {} posts selected.".format(len(src_files), total))
+            if not src_files:
+                sys.exit(0)
         
         if options["show_statuses"]:
-            self.analyze_share(post_path, src_files)
+            if options.get("format", "text") not in STATUS_FORMATS:
+                LOGGER.error("--format expects one of {}.".format(", ".join(STATUS_FORMATS)))
+                sys.exit(1)
+            self.analyze_share(src_files, options["jobs"], options.get("format", "text"))
+            sys.exit(0)
+
+        # timings of the run
+        self.report = RunReport()
+        # extracted posts of previous runs
+        self.cache = PostCache(os.path.join(plugin_folder, CACHE),
+                               self.config["import"].get("parser", "html.parser"))
+        if options.get("to_jsonl"):
+            self.export_posts(src_files, options["to_jsonl"], options["jobs"])
+            self.cache.close()
             sys.exit(0)
         
         # init new site
-        conf_template = self.generate_base_site()
+        with self.report.phase("site"):
+            conf_template = self.generate_base_site()
+            # state of the last import, used to skip unchanged posts
+            self.manifest_file = os.path.join(self.output_folder, MANIFEST)
+            if options["force"]:
+                self.manifest = new_manifest()
+            else:
+                self.manifest = load_manifest(self.manifest_file)
+        with self.report.phase("posts"):
+            self.import_posts(all_files,
+                              self.config,
+                              options["jobs"],
+                              selected=set(src_files),
+                              )
+        with self.report.phase("context"):
+            # any post will do, all have the same author data
+            post, _ = next(self.load_posts(list(src_files.values())[:1]))
+            # the POSTS globs depend on the folders the posts were written to
+            shards = None
+            if self.config["site"].get("shard"):
+                shards = sorted({e["dir"] for e in self.manifest["posts"].values() if e["slug"]})
+            self.context = self.populate_context(post,
+                                                 self.config,
+                                                 shards,
+                                                 )
+        self.cache.close()
+        with self.report.phase("config"):
+            from nikola.plugins.command.init import prepare_config
+            conf = conf_template.render(**prepare_config(self.context))
+            if self.config["image"].get("prescale"):
+                conf += PRESCALE_CONF
+            conf_hash = hashlib.sha1(conf.encode("utf-8")).hexdigest()
+            if conf_hash != self.manifest["conf"]:
+                self.write_configuration(self.get_configuration_output_path(), conf)
+                self.manifest["conf"] = conf_hash
+                save_json(self.manifest_file, self.manifest)
+            else:
+                LOGGER.info("Configuration is unchanged.")
+
         # image handling, preparations for build process
-        # copy all images to the Nikola 'images' folder
-        self.prepare_media(self.export_folder)
+        # copy the images of the imported posts to the Nikola 'images' folder
+        if self.takeout is None:
+            LOGGER.warning("No dump given, the media files of the posts are not copied.")
+        else:
+            with self.report.phase("media"):
+                self.prepare_media(self.takeout,
+                                   self.config["image"].get("media", "copy"),
+                                   self.config["image"].get("dedupe", False),
+                                   self.config["image"].get("dedupe_links", False),
+                                   )
+        # images scaled like "nikola build" would, in the watermark pass
+        # if there is one
+        scale = None
+        if self.config["image"].get("prescale"):
+            scale = (self.config["image"].get("max_size") or 1280,
+                     self.config["image"].get("thumbnail_size"))
+        watermarked = set()
         # mark images with a horizontal text line
         if self.config["image"]["watermark"]:
             if self.config["image"]["watermark_text"] == None or \
                         self.config["image"]["watermark_text"] == "":
                 LOGGER.warning("The watermark text must not be empty.")
             else:
-                self.watermark_media(self.output_folder,
-                                     self.config["image"]["watermark_text"],
-                                    )
-        
-        self.context = self.populate_context(src_files,
-                                             post_path,
-                                             self.config,
-                                             )
-        self.write_configuration(self.get_configuration_output_path(),
-                                 conf_template.render(**prepare_config(self.context))
-                                )
-        self.import_posts(src_files,
-                          post_path,
-                          self.config,
-                          )
+                with self.report.phase("watermark"):
+                    watermarked = self.watermark_media(self.output_folder,
+                                                       self.config["image"]["watermark_text"],
+                                                       self.config["image"].get("watermark_backend", "pillow"),
+                                                       options["jobs"],
+                                                       scale,
+                                                      )
+        if scale:
+            with self.report.phase("scale"):
+                self.scale_media(self.output_folder, scale[0], scale[1], options["jobs"], watermarked)
+
+        report_file = os.path.join(self.output_folder, REPORT)
+        save_json(report_file, self.report.summary())
+        LOGGER.info("Import took {:.1f} s, report written to {}.".format(self.report.elapsed(),
+                                                                         report_file))
 
     @staticmethod
-    def populate_context(names, path, config):
+    def populate_context(post, config, shards=None):
         # get info from configuration file
+        from nikola.plugins.command.init import SAMPLE_CONF
         context = SAMPLE_CONF.copy()
         context["DEFAULT_LANG"] = config["site"]["lang"]
         context["BLOG_TITLE"] = config["site"]["title"]
@@ -123,16 +322,17 @@ class CommandImportGplus(Command, ImportMixin):
         context["BLOG_EMAIL"] = config["site"]["email"] if config["site"]["email"] else ""
 
         # Get any random post, all have the same data
-        with open(os.path.join(path, names[0])) as f:
-            soup = bs4.BeautifulSoup(f, "html.parser")
-        
-        context["BLOG_AUTHOR"] = soup.find("a", "author").text
-        profile_url = soup.find("a").get("href")
+        context["BLOG_AUTHOR"] = post.author
+        profile_url = post.profile
             
+        # posts sharded to posts/YYYY/MM/ are listed before the catch-all
+        # globs which would put them below their folder in the output,
+        # Nikola only takes the first match
         context["POSTS"] = """(
-            ("posts/*.html", "posts", "post.tmpl"),
+{}            ("posts/*.html", "posts", "post.tmpl"),
             ("posts/*.rst", "posts", "post.tmpl"),
-        )"""
+        )""".format("".join('            ("posts/{}/*.html", "posts", "post.tmpl"),\n'.format(d)
+                            for d in shards or () if d))
         
         context["COMPILERS"] = """{
         "rest": (".txt", ".rst"),
@@ -160,49 +360,33 @@ class CommandImportGplus(Command, ImportMixin):
         
         return context
 
-    def analyze_share(self, path, names):
-        status_general = []
-        status_detail = []
-        for name in names:
-            with open(os.path.join(path, name)) as f:
-                soup = bs4.BeautifulSoup(f, "html.parser")
+    def analyze_share(self, sources, jobs=1, fmt="text"):
+        """
+            Show the share statuses of the posts to help with the
+            configuration. The posts are only scanned, not parsed, and
+            counted as they come in. Every status is reported with the
+            number of posts, the size of their files and the number of
+            media files they link to, the same totals are reported for
+            the categories the current configuration imports to. JSON
+            and YAML add "shared" and "import" sections to paste into
+            config.yaml.
+        """
+        classifier = VisibilityClassifier(self.config)
+        report = StatusReport(self.config["shared"], self.config["import"])
+        for header, size, media in map_parallel(scan_post, list(sources.values()), jobs):
+            category, _ = classifier.category(header)
+            report.add(header, size, media, category, classifier.classify(header)[0],
+                       classifier.classify_link(header))
+        summary = report.summary()
+        if fmt == "json":
+            print(json.dumps(summary, ensure_ascii=False, indent=2))
+            return
+        if fmt == "yaml":
+            import yaml
+            print(yaml.safe_dump(summary, allow_unicode=True, sort_keys=False,
+                                 default_flow_style=False), end="")
+            return
 
-            visibility = soup.find("div", "visibility")
-            vis_link = soup.find("div", "visibility").find("a")
-            status_general.append(visibility.contents[0].split(",")[0].rstrip())
-            if vis_link: status_detail.append(vis_link)
-            
-        status_com = []
-        status_circle = []
-        status_coll = []
-        status_event = []
-        for s in status_detail:
-            try:
-                title = s.contents[0]
-                if "communities" in s.get("href"):
-                    status_com.append(title)
-                elif "collection" in s.get("href"):
-                    status_coll.append(title)
-                elif "circle" in s.get("href"):
-                    status_circle.append(title)
-                elif  "event" in s.get("href"):
-                    status_event.append(title)
-            except IndexError:
-                if "communities" in s.get("href"):
-                    status_com.append("Deleted community")
-                elif "collection" in s.get("href"):
-                    status_coll.append("Deleted collection")
-                elif "circle" in s.get("href"):
-                    status_circle.append("Deleted circle")
-                elif "event" in s.get("href"):
-                    status_event.append("Deleted event")
-    
-        status_general = Counter(status_general)
-        status_com = Counter(status_com)
-        status_circle = Counter(status_circle)
-        status_coll = Counter(status_coll)
-        status_event = Counter(status_event)
-    
         text_gen = """
 ************************************************
 *                                              *
@@ -253,221 +437,315 @@ Events
 (edit the "import" section of your config.yaml:
     > set "events" to True to include all shares to events)
 """
+
+        text_est = """
+========
+Estimate
+========
+
+(posts, size of the post files and linked media files by category
+ as imported with the current config.yaml)
+"""
         
-        for txt, lst in [(text_gen, status_general.most_common()),
-                          (text_com, status_com.most_common()),
-                          (text_crcl, status_circle.most_common()),
-                          (text_ev, status_event.most_common()),
-                          (text_coll, status_coll.most_common()),
-                         ]:
+        for txt, section in [(text_gen, "general"),
+                             (text_com, "communities"),
+                             (text_crcl, "circles"),
+                             (text_ev, "events"),
+                             (text_coll, "collections"),
+                            ]:
             print(txt)
-            for i in lst:
-                print("{} ({})".format(i[0], i[1]))
+            for status, totals in summary[section].items():
+                print("{} ({})".format(status, totals["posts"]))
+
+        print(text_est)
+        for label, totals in list(summary["categories"].items()) + [("Not imported", summary["excluded"]),
+                                                                   ("Total", summary["total"])]:
+            print("{} ({} posts, {:.1f} MiB, {} media files)".format(label,
+                                                                   totals["posts"],
+                                                                   totals["bytes"] / 2 ** 20,
+                                                                   totals["media"]))
     
-    def import_posts(self, names, path, config):
-        """Import all posts."""
+    def load_posts(self, srcs, jobs=1):
+        """
+            Yield the post records and extraction messages of the post
+            files in order. Records are taken from the cache if the file
+            is unchanged, all others are extracted (in parallel for
+            jobs > 1) and added to the cache. Records are only loaded or
+            extracted shortly before they are needed so only a few are
+            in memory at any time.
+        """
+        cached = {src for src in srcs if self.cache.valid(src)}
+        extracted = map_parallel(functools.partial(timed, functools.partial(extract_post,
+                                                                           parser=self.cache.parser)),
+                                 [src for src in srcs if src not in cached],
+                                 jobs,
+                                 )
+        for src in srcs:
+            if src in cached:
+                yield self.cache.get(src)
+            else:
+                (post, messages), seconds = next(extracted)
+                self.report.parse[post.name] = seconds
+                self.cache.put(src, post, messages)
+                yield post, messages
+
+    def export_posts(self, sources, filename, jobs=1):
+        """
+            Write the records of the posts to a JSONL file, one post per
+            line in name order, so they can be imported with --from-jsonl
+            without parsing the HTML files again. Each line carries the
+            hash of the source file, the manifest doesn't tell posts read
+            from the dump and from the JSONL file apart.
+        """
+        names = sorted(sources)
+        tmp = filename + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            records = self.load_posts([sources[name] for name in names], jobs)
+            for name, (post, messages) in zip(names, records):
+                f.write(json.dumps({"hash": file_hash(sources[name]),
+                                    "size": source_size(sources[name]),
+                                    "record": post.to_dict(),
+                                    "messages": messages,
+                                    }, ensure_ascii=False, sort_keys=True))
+                f.write("\n")
+        os.replace(tmp, filename)
+        LOGGER.info("{} posts extracted to {}.".format(len(names), filename))
+
+    def import_posts(self, sources, config, jobs=1, selected=None):
+        """
+            Import all posts, or the selected names of a preview. Posts
+            whose source file and category are unchanged since the last
+            run (as recorded in the manifest) are skipped, outputs of
+            posts that are filtered out or gone from the dump are deleted.
+            Posts of earlier runs that are not selected are kept as they
+            are.
+
+            Links to other posts of the dump are rewritten to the imported
+            posts. The slugs are decided from the post headers before any
+            post is rendered, the index of the original post URLs
+            (self.url_map) is built from the manifest, which keeps URL and
+            slug of every post. Unchanged posts are rendered again if a
+            post they link to is added, removed or gets another slug.
+        """
         self.out_folder = "posts"
+        entries = self.manifest["posts"]
+        render = render_fingerprint(config)
+        classifier = VisibilityClassifier(config)
 
+        names = sorted(sources if selected is None else selected)
+        todo = []
+        digests = {}
+        stats = {}
+        unchanged = 0
         for name in names:
-            with open(os.path.join(path, name)) as f:
-                soup = bs4.BeautifulSoup(f, "html.parser")
-                
-            tags = []
-            
-            title_string = str(soup.title.string)
-            title = self.prettify_title(title_string)
-            
-            # post date is the 2nd link on the page
-            post_date = soup.find_all("a")[1].text
-            # receive link from post date
-            post_link = soup.find_all("a")[1].get("href")
-            
-            # collect complete post content
-            post_text = soup.find("div", "main-content")
-            link_embed = soup.find("a", "link-embed")
-            media_link = soup.find_all("a", "media-link")
-            album = soup.find("div", "album")
-            video = soup.find("div", "video-placeholder")
-            visibility = soup.find("div", "visibility")
-            vis_link = soup.find("div", "visibility").find("a")
-            activity = soup.find("div", "post-activity")
-            comments = soup.find("div", "comments")
-            
-            # show plusses and comments as h3 headline if there are any
-            try:
-                plusses = len(activity.find_all("a"))
-                plus_header = "<h3>{} «+1»</h3>".format(plusses)
-                activity = str(activity).replace("+1'd by: ", "")
-            except AttributeError:
-                plus_header = None
-            try:
-                comment_count = len(comments.find_all("div", "comment"))
-                if comment_count == 1:
-                    comment_header = "<h3>One comment:</h3>"
-                else:
-                    comment_header = "<h3>{} comments</h3>".format(comment_count)
-            except AttributeError:
-                comment_header = None
-            
-            # turn visibility status into category
-            # get name of 1st item of visibility list which is link to com/coll
-            # links to deleted profiles still exist without link text
-            if vis_link:
-                try:
-                    vis_text = vis_link.contents[0]
-                except IndexError:
-                    if "communities" in vis_link.get("href"):
-                        vis_text = "Deleted community"
-                    elif "collection" in vis_link.get("href"):
-                        vis_text = "Deleted collection"
-                    elif "event" in vis_link.get("href"):
-                        vis_text = "Deleted event"
-                    else:
-                        vis_text = "Deleted profile"
-                    # original post 404
-                    post_link = ""
-
-            # get title of com/coll/circle/event
-            vis = visibility.contents[0].rstrip()
-
-            if (vis.startswith(config["shared"]["public"]) or \
-                    vis.startswith(config["shared"]["circles"]) or \
-                    vis.startswith(config["shared"]["extcircles"])):
-                # common share status for general posts
-                cat = vis.split(",")[0] # get rid of comma if there is any
-            elif vis in config["shared"]["com"]:
-                # check if communities are ignored
-                if not config["import"]["com"]:
-                    LOGGER.warning("Community post will be ignored: {}".format(post_link))
-                    continue
-                # else check if community is in filter list
-                # empty config["import"]["com_filter"] list is NoneType 
-                elif config["import"]["com_filter"] and vis_text in config["import"]["com_filter"]:
-                    LOGGER.warning("Community post to \"{}\" will be ignored: {}".format(vis_text, post_link))
-                    continue
-                cat = "{} \"{}\"".format(vis, vis_text)
-            elif vis in config["shared"]["coll"]:
-                # collections are considered to be public
-                cat = "{} \"{}\"".format(vis, vis_text)
-            elif vis in config["shared"]["event"]:
-                if not config["import"]["event"]:
-                    LOGGER.warning("Post to event will be ignored: {}".format(post_link))
-                    continue
-                cat = "{} \"{}\"".format(vis, vis_text)
-            elif vis_link:
-                # check if post is shared with circle
-                if "circles" in vis_link.get("href"):
-                    if not config["import"]["private"]:
-                        LOGGER.warning("Private post will be ignored: {}".format(post_link))
-                        continue
-                    elif config["import"]["circle_filter"] and vis_text in config["import"]["circle_filter"]:
-                        LOGGER.warning("Post to circle \"{}\" will be ignored: {}".format(vis_text, post_link))
-                        continue
-                    cat = "Shared to circle \"{}\"".format(vis_text)
+            entry = entries.get(name)
+            # post files are only read again if their size or mtime
+            # changed, archives and JSONL files carry a checksum
+            if not isinstance(sources[name], (tuple, JsonlRef)):
+                st = os.stat(sources[name])
+                stats[name] = [st.st_mtime_ns, st.st_size]
+            if entry and name in stats and entry.get("stat") == stats[name]:
+                digests[name] = entry["hash"]
             else:
-                # everything else is considered private/other
-                if not config["import"]["private"]:
-                    LOGGER.warning("Private post will be ignored: {}".format(post_link))
+                digests[name] = file_hash(sources[name])
+            if entry and entry["hash"] == digests[name] and entry["render"] == render:
+                cat, _ = classifier.category(entry["header"])
+                if cat == entry["category"]:
+                    if name in stats:
+                        entry["stat"] = stats[name]
+                    unchanged += 1
                     continue
-                cat = config["shared"]["other"]
-            
-            if video is not None:
-                tags.append("video")
-            
-            for link in media_link:
-                # link to image in image folder if not external link
-                if not link["href"].startswith("http"):
-                    filename = link["href"]
-                    if "=" in filename:
-                        filename = filename.replace("=", "--")
-                    try:
-                        link["href"] = os.path.join("..", "..", "images", filename)
-                        tags.append("photo")
-                    except TypeError:
-                        LOGGER.warning("No href attribute to convert link destination ({})".format(link))
+            todo.append(name)
+        old_outputs = {(e["dir"], e["slug"]) for e in entries.values() if e["slug"]}
+        for name in set(entries) - set(sources):
+            del entries[name]
+        changed = set(todo)
+        # slugs in use, to tell posts with the same date and title apart
+        slugs = {e["slug"]: name for name, e in entries.items()
+                 if e["slug"] and name not in changed}
+
+        # decide on excluded posts and the slugs from the header alone so
+        # only the posts that are imported have to be parsed and links
+        # between posts can be resolved before they are rendered
+        excluded = {}
+        assigned = {}
+        links = {name: e["header"]["link"] for name, e in entries.items()
+                 if e["slug"] and name not in changed}
+        for name in todo:
+            cached = self.cache.valid(sources[name])
+            start = time.perf_counter()
+            header = read_header(sources[name])
+            if not cached:
+                self.report.parse[name] = time.perf_counter() - start
+            if classifier.category(header)[0] is None:
+                excluded[name] = header
+                continue
+            _, slug = post_slug(header["title"], header["date"])
+            if not slug:
+                continue
+            assigned[name] = unique_slug(slug, name, slugs)
+            if assigned[name] != slug:
+                LOGGER.warning("Slug {} of {} is already used by {}, using {}.".format(
+                    slug, name, slugs[slug], assigned[name]))
+            slugs[assigned[name]] = name
+            links[name] = header["link"]
+
+        # original URL of the posts to their slug, the first post in name
+        # order wins if a post is in the dump more than once
+        self.url_map = {}
+        for name in sorted(links):
+            key = post_key(links[name])
+            if key is not None:
+                self.url_map.setdefault(key, assigned.get(name) or entries[name]["slug"])
+        # unchanged posts linking to posts whose slug changed
+        relinked = set()
+        for name, entry in entries.items():
+            if name not in changed and entry["slug"] and \
+                    any(self.url_map.get(k) != v for k, v in entry.get("refs", {}).items()):
+                relinked.add(name)
+                assigned[name] = entry["slug"]
+                # posts outside of a preview selection were not checked
+                digests.setdefault(name, entry["hash"])
+                if "stat" in entry:
+                    stats.setdefault(name, entry["stat"])
+        unchanged -= len(relinked.intersection(names))
+        todo = sorted(changed | relinked)
+
+        posts = self.load_posts([sources[n] for n in todo if n not in excluded], jobs)
+        # files are written in the background while the next posts are
+        # converted
+        self.writer = PostWriter()
+
+        try:
+            for name in todo:
+                if name in excluded:
+                    record, extract_messages = PostRecord(**excluded[name]), []
+                else:
+                    record, extract_messages = next(posts)
+                timings = {}
+                messages, post = convert_post(record, extract_messages, classifier, timings,
+                                              self.url_map)
+                for level, msg in messages:
+                    getattr(LOGGER, level)(msg)
+
+                if post.category is not None and not post.slug:  # should never happen
+                    LOGGER.error("Error converting post: {}".format(post.title))
+                    return
+
+                folder = ""
+                if post.category is not None:
+                    post = post._replace(slug=assigned[name])
+                    if config["site"].get("shard"):
+                        # posts/YYYY/MM/
+                        folder = "{}/{}".format(post.date[:4], post.date[5:7])
+
+                entries[post.name] = {"hash": digests[post.name],
+                                      "render": render,
+                                      "header": post.header,
+                                      "category": post.category,
+                                      "slug": post.slug if post.category is not None else None,
+                                      "dir": folder,
+                                      "media": post.media,
+                                      }
+                if post.name in stats:
+                    entries[post.name]["stat"] = stats[post.name]
+                if post.refs:
+                    # links to other posts and the slugs they were resolved to
+                    entries[post.name]["refs"] = post.refs
+                if post.category is None:
+                    self.report.add_post(name, record, timings)
+                    continue
+
+                # additional metadata
+                # the passed metadata objects are limited by the basic_import's
+                # write_metadata fuction
+                more = {#"link": post_link, # original G+ post, thx shutdown
+                        "hidetitle": True, # doesn't work for index pages
+                        "category": post.category,
+                        }
+
+                start = time.perf_counter()
+                if config["site"].get("onefile"):
+                    # metadata in a comment at the top of the HTML file
+                    self.write_content(self.post_path(folder, post.slug, ".html"),
+                                       post.content,
+                                       header=self.metadata_text(post.title,
+                                                                 post.slug,
+                                                                 post.date,
+                                                                 "",
+                                                                 post.tags,
+                                                                 more,
+                                                                 comment_wrap=True))
+                    self.writer.remove(self.post_path(folder, post.slug, ".meta"))
+                else:
+                    self.write_metadata(self.post_path(folder, post.slug, ".meta"),
+                                        post.title,
+                                        post.slug,
+                                        post.date,
+                                        "", # description always empty
+                                        post.tags,
+                                        more)
+
+                    self.write_content(self.post_path(folder, post.slug, ".html"),
+                                       post.content)
+                # time the conversion waited for the writer
+                timings["write"] = time.perf_counter() - start
+                self.report.add_post(name, record, timings, post)
+
+                LOGGER.info("Imported post with status: {}.".format(post.category))
+        finally:
+            # all files are written before the manifest lists them
+            self.writer.close()
+            # remove posts that are filtered out now or whose source is gone
+            stale = old_outputs - {(e["dir"], e["slug"]) for e in entries.values() if e["slug"]}
+            for folder, slug in sorted(stale):
+                for ext in (".meta", ".html"):
                     try:
-                        link.img["src"] = os.path.join("..", "..", "images", filename)
-                    except TypeError:
-                        LOGGER.warning("No src attribute to convert link destination ({})".format(link))
-                # throw away redundant p tag filled with the post text
-                try:
-                    link.p.decompose()
-                except AttributeError:
-                    pass
-            
-            # multiple entries only in albums, so we only need first item
-            # BeautifulSoup.find_all() always returns result, so media_link
-            # is never None
-            try:
-                media_link = media_link[0]
-            except IndexError:
-                media_link = None
-            
-            if album is not None:
-                tags.append("photo_album")
-                # we don't need media_link if album is available
-                media_link = None
-            
-            if link_embed is not None:
-                tags.append("link")
-                # we don't need media_link if we got external link
-                media_link = None
-            
-            content = ""
-            for part in [post_text,
-                         link_embed,
-                         album,
-                         media_link,
-                         visibility,
-                         plus_header,
-                         activity,
-                         comment_header,
-                         comments]:
-                if part is not None:
-                    content = "{}\n{}\n".format(content, part)
-
-            slug = utils.slugify("{}_{}".format(post_date.split()[0], title), lang="de")
-            
-            if not slug:  # should never happen
-                LOGGER.error("Error converting post:", title)
-                return
-
-            # additional metadata
-            # the passed metadata objects are limited by the basic_import's
-            # write_metadata fuction
-            more = {#"link": post_link, # original G+ post, thx shutdown
-                    "hidetitle": True, # doesn't work for index pages
-                    "category": cat,
-                    }
-                            
-            self.write_metadata(os.path.join(self.output_folder,
-                                             self.out_folder,
-                                             slug + ".meta"),
-                                title,
-                                slug,
-                                post_date,
-                                "", # description always empty
-                                list(set(tags)),
-                                more)
-                                
-            self.write_content(
-                os.path.join(self.output_folder, self.out_folder, slug + ".html"),
-                content)
-            
-            LOGGER.info("Imported post with status: {}.".format(cat))
+                        os.remove(self.post_path(folder, slug, ext))
+                    except FileNotFoundError:
+                        pass
+                LOGGER.info("Removed post {}.".format(slug))
+            save_json(self.manifest_file, self.manifest)
+
+        self.report.unchanged = unchanged
+        self.report.removed = len(stale)
+        LOGGER.info("{} posts unchanged, {} converted, {} removed.".format(unchanged,
+                                                                           len(todo),
+                                                                           len(stale)))
+        LOGGER.info("{} files written, {} unchanged.".format(self.writer.written,
+                                                            self.writer.unchanged))
+        if relinked:
+            LOGGER.info("{} of the converted posts link to posts that changed.".format(len(relinked)))
+
+    def post_path(self, folder, slug, ext):
+        """Path of an output file of a post, folder is "" or "YYYY/MM"."""
+        return os.path.join(self.output_folder, self.out_folder, *folder.split("/") + [slug + ext])
+
+    def metadata_text(self, title, slug, post_date, description, tags, more, comment_wrap=False):
+        """Metadata of a post as written by basic_import's write_metadata."""
+        data = {"title": title,
+                "slug": slug,
+                "date": post_date,
+                "tags": ",".join(tags),
+                "description": description or "",
+                }
+        data.update(more)
+        return utils.write_metadata(data, site=self.site, comment_wrap=comment_wrap)
 
     def write_metadata(self, filename, title, slug, post_date, description, tags, more):
-        super(CommandImportGplus, self).write_metadata(
-            filename,
-            title,
-            slug,
-            post_date,
-            description,
-            tags,
-            **more
-            )
-
-    def prettify_title(self, t):
+        text = self.metadata_text(title, slug, post_date, description, tags, more)
+        self.writer.submit(filename, functools.partial(str.encode, text, "utf-8"))
+
+    def write_content(self, filename, content, rewrite_html=True, header=None):
+        """
+            Queue the post content like basic_import's write_content would
+            write it, header is put in front of it. The HTML is serialized
+            by the writer threads.
+        """
+        self.writer.submit(filename, functools.partial(html_bytes, content, rewrite_html, header))
+
+    @staticmethod
+    def prettify_title(t):
         """
             Titles are generated from post text.
             Cut junk and shorten to one line
@@ -500,37 +778,169 @@ Events
         
         return t
 
-    def prepare_media(self, folder):
-        # In the Takeout archive photos are linked to the main working
-        # directory although they do not necessarily exist there (Hello
-        # deadlinks!). The image files are spread to several folders.
+    def prepare_media(self, takeout, mode="copy", dedupe=False, dedupe_links=False):
+        """
+            Copy the media files the imported posts link to into the
+            "images" folder. In the Takeout archive photos are linked to
+            the main working directory although they do not necessarily
+            exist there (Hello deadlinks!), the files are spread to several
+            folders. They are looked up by their name in an index built by
+            a single scan of the dump. The dump itself is never modified,
+            files are copied (or linked, see MEDIA_MODES) to their new
+            name. Files copied by an earlier run that are not linked any
+            more are removed.
+
+            With dedupe files with the same content are stored once and
+            cloned for their other names, with dedupe_links the posts link
+            to the stored file instead and the duplicates are left out.
+        """
+        image_dir = os.path.join(self.output_folder, "images")
+        os.makedirs(image_dir, exist_ok=True)
+        if mode not in MEDIA_MODES:
+            LOGGER.warning("Unknown media mode {}, using copy.".format(mode))
+            mode = "copy"
+
+        references = {href for entry in self.manifest["posts"].values()
+                      if entry["category"] is not None
+                      for href in entry["media"]}
+        index = {}
+        for f, src in takeout.files():
+            if f.lower().endswith(MEDIA_EXTENSIONS):
+                index.setdefault(f, src)
+
+        wanted = {}
+        targets = {}
+        missing = 0
+        for href in sorted(references):
+            name = posixpath.basename(href)
+            src = index.get(name) or index.get(urllib.parse.unquote(name))
+            if src is None:
+                missing += 1
+                LOGGER.debug("Linked media file {} not found.".format(href))
+                continue
+            targets[href] = source_name(src).replace("=", "--")
+            wanted[targets[href]] = src
+
+        # name of the file with the same content that is stored
+        canonical = self.dedupe_media(wanted) if dedupe else {f: f for f in wanted}
+        stored = {f for f in wanted if not dedupe_links or canonical[f] == f}
 
-        # All archive photos will be copied to the "images" folder.
+        def store(f):
+            src = wanted[canonical[f]]
+            dest = os.path.join(image_dir, f)
+            if media_stat(dest) == media_stat(src):
+                return 0
+            # replace instead of overwrite, dest may be a link to the dump
+            if os.path.lexists(dest):
+                os.remove(dest)
+            if canonical[f] == f:
+                link_source(src, dest, mode)
+            else:
+                clone_file(os.path.join(image_dir, canonical[f]), dest)
+            LOGGER.debug("{} copied to image folder.".format(f))
+            return 1
+
+        copied = 0
         try:
-            os.makedirs(os.path.join(self.output_folder, "images"))
-            LOGGER.debug("Image folder created.")
-        except:
-            pass
+            # stored files first, duplicates are cloned from them
+            for f in sorted(stored, key=lambda f: (canonical[f] != f, f)):
+                copied += store(f)
+            failed = self.relink_posts({href: canonical[f] for href, f in targets.items()
+                                        if dedupe_links and canonical[f] != f})
+            # duplicates still linked by a post are kept
+            for f in sorted({targets[href] for href in failed} - stored):
+                copied += store(f)
+                stored.add(f)
+        finally:
+            removed = 0
+            for f in set(self.manifest["media"]) - stored:
+                try:
+                    os.remove(os.path.join(image_dir, f))
+                    removed += 1
+                except FileNotFoundError:
+                    pass
+            self.manifest["media"] = sorted(stored)
+            save_json(self.manifest_file, self.manifest)
+
+        if missing:
+            LOGGER.warning("{} linked media files are missing in the dump.".format(missing))
+        LOGGER.info("{} media files copied, {} up to date, {} removed.".format(copied,
+                                                                            len(stored) - copied,
+                                                                            removed))
+        if dedupe:
+            LOGGER.info("{} of {} media files are duplicates.".format(
+                sum(1 for f in wanted if canonical[f] != f), len(wanted)))
+
+    def dedupe_media(self, files):
+        """
+            Map the names of the media files to the (first) name of the
+            file with the same content. Only files of the same size are
+            hashed, the digests are kept in the manifest.
+        """
+        known = self.manifest.setdefault("digests", {})
+        sizes = Counter(media_stat(src)[0] for src in files.values())
+        digests = {}
+        for f, src in files.items():
+            stat = list(media_stat(src))
+            if sizes[stat[0]] < 2:
+                continue
+            if f not in known or known[f][:2] != stat:
+                known[f] = stat + [content_hash(src)]
+            digests[f] = known[f][2]
+        for f in set(known) - set(files):
+            del known[f]
+
+        first = {}
+        for f in sorted(digests):
+            first.setdefault(digests[f], f)
+        return {f: first[digests[f]] if f in digests else f for f in files}
+
+    def relink_posts(self, links):
+        """
+            Let the written posts link to other image files than the one
+            of the href (links maps hrefs to file names). The changed links
+            are kept in the manifest entries so posts are only rewritten if
+            their links change. Returns the hrefs of links that were not
+            found in a post, their files are still needed.
+        """
+        failed = set()
+        for entry in self.manifest["posts"].values():
+            if entry["category"] is None:
+                continue
+            old = entry.get("links", {})
+            new = {href: links[href] for href in entry["media"] if href in links}
+            if new == old:
+                continue
+            filename = self.post_path(entry["dir"], entry["slug"], ".html")
+            with open(filename, encoding="utf-8") as f:
+                content = f.read()
+            for href in set(old) | set(new):
+                default = href.replace("=", "--")
+                current = image_link(old.get(href, default))
+                if current not in content:
+                    LOGGER.debug("Link to {} not found in post {}.".format(href, entry["slug"]))
+                    new.pop(href, None)
+                    failed.add(href)
+                    continue
+                content = content.replace(current, image_link(new.get(href, default)))
+            with open(filename, "w", encoding="utf-8") as f:
+                f.write(content)
+            if new:
+                entry["links"] = new
+            else:
+                entry.pop("links", None)
+            LOGGER.debug("Links to images of post {} changed.".format(entry["slug"]))
+        return failed
 
-        for root, dirs, files in os.walk(folder):
-            for f in files:
-                if (f.lower().endswith(".jpg") or \
-                        f.lower().endswith(".jpeg") or \
-                        f.lower().endswith(".png") or \
-                        f.lower().endswith(".m4v") or \
-                        f.lower().endswith(".mp4") or \
-                        f.lower().endswith(".gif")): # 'Year in photos' 
-                    if not os.path.isfile(os.path.join(self.output_folder, "images",f)):
-                        if "=" in f:
-                            new_f = f.replace("=", "--")
-                            shutil.move(os.path.join(root, f), os.path.join(self.output_folder, "images", new_f))
-                        else:
-                            shutil.copy2(os.path.join(root, f), os.path.join(self.output_folder, "images"))
-                        LOGGER.debug("{} copied to image folder.".format(f))
-                    else:
-                        LOGGER.info("Skipping {}. File already exists.".format(f))
-
-    def watermark_media(self, folder, text):
+    def watermark_media(self, folder, text, backend="pillow", jobs=1, scale=None):
+        """
+            Watermark the static images of the "images" folder into the
+            "images_wm" folder. If scale (max. size and thumbnail size)
+            is given, the scaled images are written to "images_scaled"
+            from the watermarked image in memory, the image isn't decoded
+            again. Returns the names of the images this covers: the ones
+            drawn or up to date, not the ones that failed.
+        """
         src_img_dir = os.path.join(folder, "images")
         # save watermarked images in separate folder so you can build the
         # site again with or without watermarked images without running
@@ -541,20 +951,1659 @@ Events
         except:
             pass
         wm_img_dir = (os.path.join(folder, "images_wm"))
-        command = "convert -background \"#0008\" -fill LightGray -gravity center -size {}x{} -pointsize {} -family \"DejaVu Sans\" label:\"{}\" {} +swap -gravity center -composite {}"
+        if backend not in WATERMARK_BACKENDS:
+            LOGGER.warning("Unknown watermark backend {}, using pillow.".format(backend))
+            backend = "pillow"
+        # source hash and watermark parameters of all watermarked images
+        index_file = os.path.join(folder, WATERMARK_INDEX)
+        index = load_json(index_file, {})
+        # images are watermarked again if the scaled images change
+        params = hashlib.sha1(json.dumps([text, WATERMARK_RATIOS, backend, scale]).encode("utf-8")).hexdigest()
+        scaled_dir = os.path.join(folder, SCALED_FOLDER)
+        if scale:
+            os.makedirs(scaled_dir, exist_ok=True)
+
+        todo = []
+        sources = {}
         for image in sorted(os.listdir(src_img_dir)):
-            if not image.split(".")[1] in ("gif", "mp4", "m4v"):
-                if not os.path.isfile(os.path.join(wm_img_dir, image)):
-                    w, h = Image.open(os.path.join(src_img_dir, image)).size
-                    args = shlex.split(command.format(w,
-                                                      h / 8, # height of vertical banner
-                                                      h/ 20, #fontsize
-                                                      text,
-                                                      os.path.join(src_img_dir, image.replace(" ", "\ ")),
-                                                      os.path.join(wm_img_dir, image.replace(" ", "\ ")),
-                                                      ),
-                                        )
-                    subprocess.run(args)
+            if not os.path.splitext(image)[1].lower() in (".gif", ".mp4", ".m4v"):
+                src = os.path.join(src_img_dir, image)
+                st = os.stat(src)
+                entry = index.get(image)
+                if entry and entry["stat"] == [st.st_mtime_ns, st.st_size]:
+                    digest = entry["source"]
+                else:
+                    digest = file_hash(src)
+                sources[image] = {"stat": [st.st_mtime_ns, st.st_size],
+                                  "source": digest,
+                                  "params": params,
+                                  }
+                if entry and entry["source"] == digest and entry["params"] == params and \
+                        os.path.isfile(os.path.join(wm_img_dir, image)) and \
+                        (not scale or all(os.path.isfile(os.path.join(scaled_dir, f))
+                                          for f in scaled_names(image, scale[1]))):
+                    LOGGER.debug("Skipping {}. Watermarked image is up to date.".format(image))
+                    index[image] = sources[image]
+                else:
+                    todo.append(image)
+
+        # remove watermarked images without source, only the ones created
+        # here: files copied to the folder by hand (videos...) are kept
+        for image in sorted(set(index) - set(sources)):
+            try:
+                os.remove(os.path.join(wm_img_dir, image))
+                LOGGER.info("Removed orphaned watermarked image {}.".format(image))
+            except FileNotFoundError:
+                pass
+            del index[image]
+
+        draw = functools.partial(watermark_image,
+                                 src_img_dir,
+                                 wm_img_dir,
+                                 text=text,
+                                 backend=backend,
+                                 scaled_dir=scaled_dir if scale else None,
+                                 scale=scale,
+                                 )
+        covered = set(sources) - set(todo)
+        created = 0
+        try:
+            for image, error in map_parallel(draw, todo, jobs):
+                if error:
+                    LOGGER.error("Could not watermark {}: {}".format(image, error))
+                    index.pop(image, None)
+                else:
                     LOGGER.debug("Created watermarked image of {}.".format(image))
+                    index[image] = sources[image]
+                    covered.add(image)
+                    created += 1
+        finally:
+            save_json(index_file, index)
+        LOGGER.info("{} watermarked images created, {} up to date, {} failed.".format(
+            created, len(sources) - len(todo), len(todo) - created))
+        return covered
+
+    def scale_media(self, folder, max_size, thumbnail_size=None, jobs=1, watermarked=()):
+        """
+            Scale the images of the "images" folder to the "images_scaled"
+            folder the way "nikola build" would (see PRESCALE_CONF), with
+            a thumbnail only if thumbnail_size is given: the imported posts
+            don't use them. Videos and animations are linked as they are.
+            The images in watermarked were already scaled by the watermark
+            pass.
+        """
+        src_img_dir = os.path.join(folder, "images")
+        scaled_dir = os.path.join(folder, SCALED_FOLDER)
+        os.makedirs(scaled_dir, exist_ok=True)
+        index_file = os.path.join(folder, SCALED_INDEX)
+        index = load_json(index_file, {})
+        params = hashlib.sha1(json.dumps([max_size, thumbnail_size]).encode("utf-8")).hexdigest()
+
+        todo = []
+        sources = {}
+        expected = set()
+        for image in sorted(os.listdir(src_img_dir)):
+            names = scaled_names(image, thumbnail_size)
+            expected.update(names)
+            if image in watermarked:
+                continue
+            src = os.path.join(src_img_dir, image)
+            st = os.stat(src)
+            entry = index.get(image)
+            if entry and entry["stat"] == [st.st_mtime_ns, st.st_size]:
+                digest = entry["source"]
+            else:
+                digest = file_hash(src)
+            sources[image] = {"stat": [st.st_mtime_ns, st.st_size],
+                              "source": digest,
+                              "params": params,
+                              }
+            if entry and entry["source"] == digest and entry["params"] == params and \
+                    all(os.path.isfile(os.path.join(scaled_dir, f)) for f in names):
+                index[image] = sources[image]
+            else:
+                todo.append(image)
+
+        # remove scaled images without source and thumbnails not wanted any more
+        for f in sorted(set(os.listdir(scaled_dir)) - expected):
+            os.remove(os.path.join(scaled_dir, f))
+            LOGGER.debug("Removed scaled image {}.".format(f))
+        for image in set(index) - set(sources):
+            del index[image]
+
+        scale = functools.partial(scale_image,
+                                  src_img_dir,
+                                  scaled_dir,
+                                  max_size=max_size,
+                                  thumbnail_size=thumbnail_size,
+                                  )
+        created = 0
+        try:
+            for image, error in map_parallel(scale, todo, jobs):
+                if error:
+                    LOGGER.error("Could not scale {}: {}".format(image, error))
+                    index.pop(image, None)
                 else:
-                    LOGGER.info("Skipping {}. Watermarked image already exists.".format(image))
+                    index[image] = sources[image]
+                    created += 1
+        finally:
+            save_json(index_file, index)
+        LOGGER.info("{} scaled images created, {} up to date, {} failed.".format(
+            created, len(sources) - len(todo), len(todo) - created))
+
+
+class PostWriter(object):
+    """
+        Write the output files of the posts in a few background threads
+        so the conversion doesn't wait for the disk. Files are submitted
+        with a function returning their content, which is called by the
+        thread as well. Only a limited number of files is queued, submit
+        blocks if the writers fall behind. Files are written to a temporary
+        file which replaces the old one, unchanged files are not written
+        at all. The first error is raised by close().
+    """
+
+    def __init__(self, threads=None, queue=None):
+        import concurrent.futures
+        import threading
+        self.pool = concurrent.futures.ThreadPoolExecutor(max_workers=threads or WRITER_THREADS,
+                                                          thread_name_prefix="import_gplus_writer")
+        self.slots = threading.BoundedSemaphore(queue or WRITER_QUEUE)
+        self.lock = threading.Lock()
+        self.written = 0
+        self.unchanged = 0
+        self.errors = []
+
+    def submit(self, filename, content):
+        self.slots.acquire()
+        self.pool.submit(self._write, filename, content).add_done_callback(self._done)
+
+    def remove(self, filename):
+        """Remove a file (if it exists) after the files submitted before."""
+        self.slots.acquire()
+        self.pool.submit(self._remove, filename).add_done_callback(self._done)
+
+    def _done(self, future):
+        self.slots.release()
+        error = future.exception()
+        with self.lock:
+            if error is not None:
+                self.errors.append(error)
+            elif future.result() is True:
+                self.written += 1
+            elif future.result() is False:
+                self.unchanged += 1
+
+    @staticmethod
+    def _write(filename, content):
+        data = content()
+        try:
+            with open(filename, "rb") as f:
+                if os.fstat(f.fileno()).st_size == len(data) and f.read() == data:
+                    return False
+        except FileNotFoundError:
+            os.makedirs(os.path.dirname(filename), exist_ok=True)
+        tmp = "{}.{}.tmp".format(filename, os.getpid())
+        with open(tmp, "wb") as f:
+            f.write(data)
+        os.replace(tmp, filename)
+        return True
+
+    @staticmethod
+    def _remove(filename):
+        try:
+            os.remove(filename)
+        except FileNotFoundError:
+            pass
+
+    def close(self):
+        self.pool.shutdown(wait=True)
+        if self.errors:
+            raise self.errors[0]
+
+
+class PostCache(object):
+    """
+        Extracted post records of previous runs in a SQLite database,
+        keyed by file path, mtime and size of the post file (CRC instead
+        of mtime for archive members).
+    """
+
+    def __init__(self, filename, parser):
+        import sqlite3
+        self.parser = parser
+        self.db = sqlite3.connect(filename)
+        self.db.execute("""CREATE TABLE IF NOT EXISTS posts (
+                               path TEXT PRIMARY KEY,
+                               mtime INTEGER,
+                               size INTEGER,
+                               version TEXT,
+                               data TEXT)""")
+        self._pending = 0
+
+    def _key(self, src):
+        return source_stat(src) + ("{}:{}".format(EXTRACT_VERSION, self.parser),)
+
+    def get(self, src):
+        """Return (record, messages) or None if missing or outdated."""
+        key = self._key(src)
+        row = self.db.execute("SELECT mtime, size, version, data FROM posts WHERE path = ?",
+                              key[:1]).fetchone()
+        if row is None or tuple(row[:3]) != key[1:]:
+            return None
+        post, messages = json.loads(row[3])
+        return PostRecord(**post), messages
+
+    def put(self, src, post, messages):
+        if isinstance(src, JsonlRef):
+            return
+        self.db.execute("INSERT OR REPLACE INTO posts VALUES (?, ?, ?, ?, ?)",
+                        self._key(src) + (json.dumps([post.to_dict(), messages]),))
+        self._pending += 1
+        if self._pending >= 500:
+            self.db.commit()
+            self._pending = 0
+
+    def valid(self, src):
+        """Check if there is an up-to-date record without loading it."""
+        if isinstance(src, JsonlRef):
+            # read from the JSONL file, nothing to save by caching
+            return False
+        key = self._key(src)
+        row = self.db.execute("SELECT mtime, size, version FROM posts WHERE path = ?",
+                              key[:1]).fetchone()
+        return row is not None and tuple(row) == key[1:]
+
+    def close(self):
+        self.db.commit()
+        self.db.close()
+
+
+class StatusReport(object):
+    """
+        Share statuses of the posts for --statuses, counted while the
+        posts are scanned. Only the totals of every status are kept: the
+        number of posts, the size of their files and the number of media
+        files they link to. The status strings are collected by their key
+        in the "shared" section (shared and options are the current
+        "shared" and "import" sections).
+    """
+
+    def __init__(self, shared, options):
+        self.shared = shared
+        self.options = options
+        self.sections = {section: {} for section in STATUS_SECTIONS}
+        self.statuses = {key: Counter() for key in STATUS_SHARED}
+        self.categories = {}
+        self.excluded = self._totals()
+        self.total = self._totals()
+
+    @staticmethod
+    def _totals():
+        return {"posts": 0, "bytes": 0, "media": 0}
+
+    @staticmethod
+    def _count(totals, size, media):
+        totals["posts"] += 1
+        totals["bytes"] += size
+        totals["media"] += media
+
+    def add(self, header, size, media, category, kind, link):
+        """
+            Count a post, kind is the kind of its share status and link
+            the kind and label of the share status link, as returned by
+            the classify methods of VisibilityClassifier.
+        """
+        status = header["vis"].split(",")[0].rstrip()
+        self._count(self.sections["general"].setdefault(status, self._totals()), size, media)
+        if kind in VISIBILITY_GENERAL:
+            self.statuses[kind.value][status] += 1
+        link_kind, label = link
+        if link_kind is not None:
+            totals = self.sections[STATUS_DETAILS[link_kind.value]].setdefault(label, self._totals())
+            self._count(totals, size, media)
+            if link_kind.value in self.statuses:
+                # the classifier compares the whole status
+                self.statuses[link_kind.value][header["vis"].rstrip()] += 1
+        if category is None:
+            self._count(self.excluded, size, media)
+        else:
+            self._count(self.categories.setdefault(category, self._totals()), size, media)
+        self._count(self.total, size, media)
+
+    def summary(self):
+        def ordered(statuses):
+            # most posts first, ties in the order of appearance
+            return dict(sorted(statuses.items(), key=lambda s: s[1]["posts"], reverse=True))
+        summary = {section: ordered(self.sections[section]) for section in STATUS_SECTIONS}
+        summary["categories"] = ordered(self.categories)
+        summary["excluded"] = self.excluded
+        summary["total"] = self.total
+        summary.update(self.config(summary))
+        return summary
+
+    def config(self, summary):
+        """
+            The "shared" section with the statuses found in the dump (one
+            string or a list, the current value if there is none) and
+            the "import" section with the current options and filters
+            listing all communities and circles, remove the ones to
+            import. The names are the labels of the classifier.
+        """
+        shared = {}
+        for key in STATUS_SHARED:
+            statuses = [status for status, _ in self.statuses[key].most_common()]
+            shared[key] = (statuses[0] if len(statuses) == 1 else statuses) or self.shared[key]
+        shared["other"] = self.shared["other"]
+        options = dict(self.options)
+        # empty filter lists are None
+        options["circle_filter"] = list(summary["circles"]) or None
+        options["com_filter"] = list(summary["communities"]) or None
+        return {"shared": shared, "import": options}
+
+
+class RunReport(object):
+    """
+        Durations of the phases of an import and numbers per converted
+        post, summarized as JSON at the end of the run. Only totals and
+        the slowest posts are kept so the report doesn't grow with the
+        dump.
+    """
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.phases = {}
+        # seconds spent extracting (or scanning) posts, by name, until
+        # the post is added
+        self.parse = {}
+        self.counts = Counter()
+        self.totals = Counter({k: 0 for k in REPORT_TIMINGS + ("total", "bytes", "comments", "media")})
+        self.histogram = Counter()
+        # heap of (total, order, stats) of the slowest posts
+        self.slowest = []
+        self.unchanged = 0
+        self.removed = 0
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases[name] = self.phases.get(name, 0) + time.perf_counter() - start
+
+    def elapsed(self):
+        return time.perf_counter() - self.start
+
+    def add_post(self, name, record, timings, post=None):
+        parse = self.parse.pop(name, None)
+        stats = {"name": name,
+                 "slug": post.slug if post else None,
+                 "category": post.category if post else None,
+                 "cached": parse is None,
+                 "parse": parse or 0.0,
+                 "classify": timings.get("classify", 0.0),
+                 "render": timings.get("render", 0.0),
+                 "write": timings.get("write", 0.0),
+                 "bytes": len(post.content.encode("utf-8")) if post else 0,
+                 "comments": record.comment_count or 0,
+                 "media": len(record.media or ()),
+                 }
+        stats["total"] = sum(stats[k] for k in REPORT_TIMINGS)
+
+        self.counts["converted"] += 1
+        self.counts["imported"] += post is not None
+        self.counts["cached"] += stats["cached"]
+        self.totals.update({k: stats[k] for k in self.totals})
+        ms = stats["total"] * 1000
+        self.histogram[next((b for b in REPORT_HISTOGRAM if ms < b), None)] += 1
+        entry = (stats["total"], self.counts["converted"], stats)
+        if len(self.slowest) < REPORT_SLOWEST:
+            heapq.heappush(self.slowest, entry)
+        else:
+            heapq.heappushpop(self.slowest, entry)
+
+    def summary(self):
+        posts = dict(self.counts, unchanged=self.unchanged, removed=self.removed)
+        for key in ("converted", "imported", "cached"):
+            posts.setdefault(key, 0)
+        return {"seconds": self.elapsed(),
+                "phases": self.phases,
+                "posts": posts,
+                "totals": dict(self.totals),
+                "slowest": [stats for _, _, stats in sorted(self.slowest, reverse=True)],
+                # number of posts by total time, up to the given milliseconds
+                "histogram": [{"below_ms": b, "posts": self.histogram[b]}
+                              for b in REPORT_HISTOGRAM + (None,)],
+                }
+
+
+def load_config(filename):
+    """
+        Read the plugin configuration with the safe YAML loader. The
+        result is cached as long as the file is unchanged, callers get
+        their own copy.
+    """
+    st = os.stat(filename)
+    return copy.deepcopy(_load_config(os.path.abspath(filename), st.st_mtime_ns, st.st_size))
+
+
+@functools.lru_cache(maxsize=4)
+def _load_config(filename, mtime, size):
+    import yaml
+    with open(filename, encoding="utf-8") as f:
+        return yaml.safe_load(f)
+
+
+def load_json(filename, default):
+    try:
+        with open(filename, encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return default
+
+
+def save_json(filename, data):
+    """Write the file atomically so an interrupted run can't corrupt it."""
+    tmp = filename + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False, sort_keys=True)
+    os.replace(tmp, filename)
+
+
+def new_manifest():
+    return {"version": MANIFEST_VERSION, "conf": None, "posts": {}, "media": [], "digests": {}}
+
+
+def load_manifest(filename):
+    """Load the manifest of the last import, start a new one if missing."""
+    manifest = load_json(filename, None)
+    if not manifest or manifest.get("version") != MANIFEST_VERSION:
+        return new_manifest()
+    return manifest
+
+
+def file_hash(src):
+    if isinstance(src, JsonlRef):
+        return src.digest
+    if isinstance(src, tuple):
+        # archives already carry a checksum of their members
+        info = _archive(src[0]).getinfo(src[1])
+        return "crc32:{:08x}:{}".format(info.CRC, info.file_size)
+    return content_hash(src)
+
+
+def content_hash(src, chunk_size=1 << 16):
+    """SHA-1 of a file of the dump, read in chunks."""
+    digest = hashlib.sha1()
+    with open_source(src, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def render_fingerprint(config):
+    """Hash of the configuration values the post output depends on."""
+    relevant = {"parser": config["import"].get("parser", "html.parser"),
+                "shard": bool(config["site"].get("shard")),
+                "links": LINK_FORMAT,
+                "onefile": bool(config["site"].get("onefile")),
+                }
+    return hashlib.sha1(json.dumps(relevant, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+class Takeout(object):
+    """
+        Files of a Takeout dump, either the extracted folder or one or
+        more zip archives. The parts of multi-part archives are merged by
+        an index of their members, nothing is extracted. Files are
+        addressed by their path or by an (archive, member) tuple, both
+        can be passed to worker processes.
+    """
+
+    def __init__(self, args):
+        if all(a.lower().endswith(".zip") and os.path.isfile(a) for a in args):
+            self.folder = None
+            self.members = {}
+            for archive in args:
+                archive = os.path.abspath(archive)
+                for info in _archive(archive).infolist():
+                    if not info.is_dir():
+                        self.members[_member_name(info)] = (archive, info.filename)
+        else:
+            self.folder = os.path.join(args[0], "Takeout")
+
+    def posts(self, stream, posts):
+        """Map the names of all post files to their sources."""
+        if self.folder:
+            post_path = os.path.join(self.folder, stream, posts)
+            with os.scandir(post_path) as entries:
+                return {e.name: e.path for e in entries
+                        if e.name.endswith(".html") and e.is_file()}
+        prefix = "/".join(("Takeout", stream, posts, ""))
+        return {m[len(prefix):]: src for m, src in self.members.items()
+                if m.startswith(prefix) and m.endswith(".html") and "/" not in m[len(prefix):]}
+
+    def files(self):
+        """Yield name and source of all files in the dump."""
+        if self.folder:
+            for root, dirs, files in os.walk(self.folder):
+                for f in files:
+                    yield f, os.path.join(root, f)
+        else:
+            for member, src in self.members.items():
+                yield posixpath.basename(member), src
+
+
+# open archives, per process because forked workers can't share the file
+# position with their parent
+_archives = {}
+
+
+def _archive(filename):
+    key = (os.getpid(), filename)
+    if key not in _archives:
+        import zipfile
+        _archives[key] = zipfile.ZipFile(filename)
+    return _archives[key]
+
+
+def _member_name(info):
+    """
+        Member names without the UTF-8 flag are decoded as cp437 by
+        zipfile although most archivers write UTF-8.
+    """
+    if info.flag_bits & 0x800:
+        return info.filename
+    try:
+        return info.filename.encode("cp437").decode("utf-8")
+    except UnicodeError:
+        return info.filename
+
+
+def open_source(src, mode="r"):
+    """Open a file of the dump, src being a path or an archive member."""
+    if isinstance(src, tuple):
+        f = _archive(src[0]).open(src[1])
+        return f if "b" in mode else io.TextIOWrapper(f)
+    return open(src, mode)
+
+
+def source_name(src):
+    if isinstance(src, JsonlRef):
+        return src.name
+    if isinstance(src, tuple):
+        return posixpath.basename(_member_name(_archive(src[0]).getinfo(src[1])))
+    return os.path.basename(src)
+
+
+def source_size(src):
+    """Size of a post file, JSONL references know the size of their source."""
+    if isinstance(src, JsonlRef):
+        return src.size or 0
+    return source_stat(src)[2]
+
+
+def source_stat(src):
+    """Identity, mtime (CRC for archive members) and size of a file."""
+    if isinstance(src, tuple):
+        info = _archive(src[0]).getinfo(src[1])
+        return ("{}::{}".format(src[0], src[1]), info.CRC, info.file_size)
+    st = os.stat(src)
+    return (os.path.abspath(src), st.st_mtime_ns, st.st_size)
+
+
+def media_stat(filename):
+    """Size and mtime of a copied media file or its source, None if missing."""
+    if isinstance(filename, tuple):
+        info = _archive(filename[0]).getinfo(filename[1])
+        return (info.file_size, int(time.mktime(info.date_time + (0, 0, -1))))
+    try:
+        st = os.stat(filename)
+    except FileNotFoundError:
+        return None
+    return (st.st_size, int(st.st_mtime))
+
+
+def link_source(src, dest, mode="copy"):
+    """
+        Copy a file of the dump or link to it. Archive members are always
+        copied, hard links fall back to a copy across file systems.
+    """
+    if not isinstance(src, tuple):
+        if mode == "symlink":
+            return os.symlink(os.path.abspath(src), dest)
+        if mode == "hardlink":
+            try:
+                return os.link(src, dest)
+            except OSError:
+                pass
+    return copy_source(src, dest)
+
+
+def clone_file(src, dest):
+    """
+        Duplicate a file without copying its content: as a reflink
+        (copy-on-write clone, Linux) or as a hard link. The file is copied
+        if the file system supports neither.
+    """
+    import shutil
+    try:
+        import fcntl
+        with open(src, "rb") as fsrc, open(dest, "wb") as fdst:
+            fcntl.ioctl(fdst.fileno(), FICLONE, fsrc.fileno())
+        shutil.copystat(src, dest)
+        return
+    except (ImportError, OSError):
+        if os.path.exists(dest):
+            os.remove(dest)
+    try:
+        os.link(src, dest)
+    except OSError:
+        shutil.copy2(src, dest)
+
+
+def copy_source(src, dest):
+    """Copy a file of the dump, keeping the modification time."""
+    import shutil
+    if not isinstance(src, tuple):
+        return shutil.copy2(src, dest)
+    with open_source(src, "rb") as fsrc, open(dest, "wb") as fdst:
+        shutil.copyfileobj(fsrc, fdst, 1 << 20)
+    mtime = time.mktime(_archive(src[0]).getinfo(src[1]).date_time + (0, 0, -1))
+    os.utime(dest, (mtime, mtime))
+
+
+@functools.lru_cache(maxsize=32)
+def _font(size):
+    from PIL import ImageFont
+    try:
+        return ImageFont.truetype("DejaVuSans.ttf", size)
+    except OSError:
+        try:
+            return ImageFont.load_default(size)
+        except TypeError:  # Pillow < 10.1
+            return ImageFont.load_default()
+
+
+def watermark_image(src_dir, dest_dir, image, text, backend="pillow", scaled_dir=None, scale=None):
+    """
+        Mark an image with a horizontal banner across its middle: the
+        banner is 1/8 of the image height with a translucent black
+        (#0008) background and light gray text of 1/20 of the image
+        height. The marked image is scaled to scaled_dir if scale (max.
+        size and thumbnail size) is given. Runs in worker processes,
+        returns the image name and an error message or None.
+    """
+    import subprocess
+    from PIL import Image, ImageDraw, JpegImagePlugin
+    src = os.path.join(src_dir, image)
+    dest = os.path.join(dest_dir, image)
+    try:
+        if backend == "imagemagick":
+            w, h = Image.open(src).size
+            args = [arg.format(w=w,
+                               h=h / WATERMARK_RATIOS[0], # height of vertical banner
+                               size=h / WATERMARK_RATIOS[1], #fontsize
+                               text=text,
+                               src=src,
+                               dest=dest,
+                               ) for arg in WATERMARK_COMMAND]
+            subprocess.run(args, check=True)
+            if scale:
+                return scale_image(dest_dir, scaled_dir, image, *scale)
+            return image, None
+
+        with Image.open(src) as im:
+            w, h = im.size
+            banner_height = max(1, h // WATERMARK_RATIOS[0])
+            banner = Image.new("RGBA", (w, banner_height), (0, 0, 0, 0x88))
+            ImageDraw.Draw(banner).text((w / 2, banner_height / 2),
+                                        text,
+                                        font=_font(max(1, h // WATERMARK_RATIOS[1])),
+                                        fill="lightgray",
+                                        anchor="mm",
+                                        )
+            marked = im.convert("RGBA")
+            marked.alpha_composite(banner, (0, (h - banner_height) // 2))
+            options = {}
+            if im.format == "JPEG":
+                marked = marked.convert("RGB")
+                # keep the quality of the original
+                options["qtables"] = im.quantization
+                sampling = JpegImagePlugin.get_sampling(im)
+                if sampling != -1:
+                    options["subsampling"] = sampling
+            elif im.mode not in ("RGBA", "LA", "PA"):
+                marked = marked.convert("RGB")
+            for key in ("exif", "icc_profile"):
+                if im.info.get(key):
+                    options[key] = im.info[key]
+            marked.save(dest, format=im.format, **options)
+            if scale:
+                save_scaled(marked, im.format, scaled_dir, image, *scale)
+    except (OSError, ValueError, subprocess.CalledProcessError) as e:
+        return image, str(e)
+    return image, None
+
+
+def scaled_names(image, thumbnail_size=None):
+    """Names of the scaled image and its thumbnail in the scaled folder."""
+    name, ext = os.path.splitext(image)
+    if thumbnail_size is None or ext.lower() not in SCALE_EXTENSIONS:
+        return [image]
+    return [image, SCALED_THUMBNAIL.format(name=name, ext=ext)]
+
+
+def scale_image(src_dir, dest_dir, image, max_size, thumbnail_size=None):
+    """
+        Write the scaled image (and thumbnail) of an image to dest_dir.
+        Animations are linked as they are for both like Nikola does, all
+        other files Nikola doesn't scale (videos) are linked without a
+        thumbnail. Runs in worker processes, returns the image name and
+        an error message or None.
+    """
+    from PIL import Image
+    src = os.path.join(src_dir, image)
+    ext = os.path.splitext(image)[1].lower()
+    try:
+        if ext in SCALE_EXTENSIONS:
+            with Image.open(src) as im:
+                # only animated GIFs, see Nikola issue #3332
+                if getattr(im, "n_frames", 1) == 1 or ext in (".jpg", ".jpeg"):
+                    save_scaled(im, im.format, dest_dir, image, max_size, thumbnail_size)
+                    return image, None
+        for name in scaled_names(image, thumbnail_size):
+            dest = os.path.join(dest_dir, name)
+            # never write into a link to the source
+            if os.path.lexists(dest):
+                os.remove(dest)
+            clone_file(src, dest)
+    except (OSError, ValueError) as e:
+        return image, str(e)
+    return image, None
+
+
+def save_scaled(im, fmt, dest_dir, image, max_size, thumbnail_size=None):
+    """
+        Save an image scaled down like Nikola's image task does: turned
+        upright by its EXIF orientation, fitted into a square of the size
+        (panoramas into four times the size) and saved without metadata.
+    """
+    from PIL import Image, ImageOps
+    im = ImageOps.exif_transpose(im)
+    for name, size in zip(scaled_names(image, thumbnail_size), (max_size, thumbnail_size)):
+        scaled = im.copy()
+        w, h = scaled.size
+        if w > size or h > size:
+            box = (size, size)
+            if w > 3 * h:
+                box = (min(w, size * 4), min(w, size * 4))
+            scaled.thumbnail(box, Image.LANCZOS)
+        dest = os.path.join(dest_dir, name)
+        if os.path.lexists(dest):
+            os.remove(dest)
+        scaled.save(dest, format=fmt)
+
+
+def select_posts(sources, since=None, until=None, sample=None, seed=0, limit=None):
+    """
+        Select part of the posts for a preview. The sample is chosen by a
+        hash of the post name and the seed so it is the same on every run
+        (and grows with the ratio). Dates are compared as prefixes of the
+        post date, read by the header scan. The limit applies to the
+        selected posts in name order.
+    """
+    selected = {}
+    for name in sorted(sources):
+        if limit is not None and len(selected) >= limit:
+            break
+        if sample is not None:
+            digest = hashlib.sha1("{}:{}".format(seed, name).encode("utf-8")).digest()
+            if int.from_bytes(digest[:8], "big") >= sample * 2 ** 64:
+                continue
+        if since or until:
+            date = read_header(sources[name])["date"]
+            if since and date[:len(since)] < since:
+                continue
+            if until and date[:len(until)] > until:
+                continue
+        selected[name] = sources[name]
+    return selected
+
+
+def unique_slug(slug, name, slugs):
+    """
+        Append a number to the slug if another post uses it already
+        (slugs maps slugs to post names).
+    """
+    candidate, n = slug, 1
+    while slugs.get(candidate, name) != name:
+        n += 1
+        candidate = "{}-{}".format(slug, n)
+    return candidate
+
+
+def timed(func, arg):
+    """Return func(arg) and the seconds it took."""
+    start = time.perf_counter()
+    return func(arg), time.perf_counter() - start
+
+
+def map_parallel(func, names, jobs=1):
+    """
+        Apply func to all names, in a process pool if more than one job
+        is requested. Results are yielded in the order of
+        names so the output doesn't depend on the number of workers.
+        Names are handed out in chunks and only a few chunks per worker
+        are submitted ahead so results don't pile up if the consumer is
+        slower than the workers.
+    """
+    if jobs == 1 or len(names) < 2:
+        for name in names:
+            yield func(name)
+        return
+    import concurrent.futures
+    import multiprocessing
+    # workers are forked so they don't have to re-import the plugin
+    # module which isn't on sys.path
+    try:
+        context = multiprocessing.get_context("fork")
+    except ValueError:
+        context = None
+    workers = jobs or os.cpu_count() or 1
+    chunks = (names[i:i + MAP_CHUNKSIZE] for i in range(0, len(names), MAP_CHUNKSIZE))
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers,
+                                                mp_context=context) as pool:
+        pending = deque(pool.submit(_map_chunk, func, chunk)
+                                    for chunk in itertools.islice(chunks, 2 * workers))
+        while pending:
+            results = pending.popleft().result()
+            for chunk in itertools.islice(chunks, 1):
+                pending.append(pool.submit(_map_chunk, func, chunk))
+            for result in results:
+                yield result
+
+
+def _map_chunk(func, names):
+    return [func(name) for name in names]
+
+
+MANIFEST = ".import_gplus_manifest.json"
+MANIFEST_VERSION = 3
+CACHE = "post_cache.sqlite"
+# posts handed to a worker process at once
+MAP_CHUNKSIZE = 16
+REPORT = ".import_gplus_report.json"
+PROFILE = "import_gplus.prof"
+REPORT_TIMINGS = ("parse", "classify", "render", "write")
+REPORT_SLOWEST = 20
+# upper bounds (ms) of the post time histogram
+REPORT_HISTOGRAM = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)
+# bump if the post records change
+EXTRACT_VERSION = 1
+# threads writing the post files and the number of files queued for them
+WRITER_THREADS = 4
+WRITER_QUEUE = 64
+
+STATUS_FORMATS = ("text", "json", "yaml")
+STATUS_SECTIONS = ("general", "communities", "circles", "events", "collections")
+# sections of the communities, collections, circles and events by the
+# kind of the share status link (see VisibilityClassifier.classify_link)
+STATUS_DETAILS = {"com": "communities",
+                  "coll": "collections",
+                  "circle": "circles",
+                  "event": "events",
+                  }
+# keys of the "shared" section filled from the statuses of the dump
+STATUS_SHARED = ("public", "circles", "extcircles", "com", "coll", "event")
+
+# 'Year in photos' are gifs
+MEDIA_EXTENSIONS = (".jpg", ".jpeg", ".png", ".m4v", ".mp4", ".gif")
+MEDIA_MODES = ("copy", "hardlink", "symlink")
+# ioctl request cloning a file (linux/fs.h)
+FICLONE = 0x40049409
+
+# images scaled during the import and how conf.py copies them
+SCALED_FOLDER = "images_scaled"
+SCALED_INDEX = ".import_gplus_scaled.json"
+SCALED_THUMBNAIL = "{name}.thumbnail{ext}"
+# files Nikola scales, others are passed as they are
+SCALE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".gif", ".bmp", ".tiff", ".webp")
+PRESCALE_CONF = """
+# The images are scaled by the import (prescale in the config.yaml of
+# the import_gplus plugin) and only copied to the output.
+IMAGE_FOLDERS = {}
+FILES_FOLDERS = {"files": "files", "images_scaled": "images"}
+"""
+
+WATERMARK_BACKENDS = ("pillow", "imagemagick")
+WATERMARK_INDEX = ".import_gplus_watermarks.json"
+# banner height and font size as fractions of the image height
+WATERMARK_RATIOS = (8, 20)
+WATERMARK_COMMAND = ["convert",
+                     "-background", "#0008",
+                     "-fill", "LightGray",
+                     "-gravity", "center",
+                     "-size", "{w}x{h}",
+                     "-pointsize", "{size}",
+                     "-family", "DejaVu Sans",
+                     "label:{text}",
+                     "{src}",
+                     "+swap",
+                     "-gravity", "center",
+                     "-composite",
+                     "{dest}",
+                     ]
+
+ConvertedPost = namedtuple("ConvertedPost",
+                           ["name", "header", "slug", "title", "date", "tags", "category", "content",
+                            "media", "refs"])
+
+# header fields the post classification depends on
+CLASSIFY_FIELDS = ("link", "vis", "vis_href", "vis_text")
+# fields of a post record read by the header scan
+HEADER_FIELDS = ("name", "title", "author", "profile", "date") + CLASSIFY_FIELDS
+
+
+class Visibility(enum.Enum):
+    """Kinds of share status, the values are the keys of the "shared" section."""
+    PUBLIC = "public"
+    CIRCLES = "circles"
+    EXTCIRCLES = "extcircles"
+    COMMUNITY = "com"
+    COLLECTION = "coll"
+    EVENT = "event"
+    CIRCLE = "circle"
+    OTHER = "other"
+
+
+# statuses whose category is the status itself
+VISIBILITY_GENERAL = (Visibility.PUBLIC, Visibility.CIRCLES, Visibility.EXTCIRCLES)
+# share status links: part of the link, kind and the name if the link has
+# no text (deleted), in the order they are tried
+LINK_KINDS = (("communities", Visibility.COMMUNITY, "Deleted community"),
+              ("collection", Visibility.COLLECTION, "Deleted collection"),
+              ("circle", Visibility.CIRCLE, "Deleted circle"),
+              ("event", Visibility.EVENT, "Deleted event"),
+              )
+
+
+class VisibilityClassifier(object):
+    """
+        The share status rules of the "shared" and "import" sections of
+        config.yaml, compiled once for all posts: the statuses of public
+        and circle posts into one pattern, the other statuses and the
+        filters into sets. Every status can be a list of strings, one for
+        each language of the dump. The import and --statuses share it so
+        they can't disagree.
+    """
+
+    def __init__(self, config):
+        shared = config["shared"]
+        options = config["import"]
+        general = sorted(((status, kind) for kind in VISIBILITY_GENERAL
+                          for status in _strings(shared[kind.value])),
+                         # longest first, a status may start with another one
+                         key=lambda g: len(g[0]), reverse=True)
+        # matches nothing if there are no statuses
+        self.general = re.compile("|".join("({})".format(re.escape(s)) for s, _ in general) or "(?!)").match
+        self.general_kinds = [kind for _, kind in general]
+        self.named = {status: kind for kind in (Visibility.COMMUNITY, Visibility.COLLECTION, Visibility.EVENT)
+                      for status in _strings(shared[kind.value])}
+        self.other = shared["other"]
+        self.com = options["com"]
+        self.event = options["event"]
+        self.private = options["private"]
+        # empty filter lists are None
+        self.com_filter = frozenset(options["com_filter"] or ())
+        self.circle_filter = frozenset(options["circle_filter"] or ())
+        # results by share status, posts have only a few different ones
+        self.kinds = {}
+        self.categories = {}
+
+    def classify(self, header):
+        """
+            Kind of the share status of a post and its label: the status
+            for public, circle and other posts, the name of the community,
+            collection, event or circle for the others.
+        """
+        key = (header["vis"], header["vis_href"], header["vis_text"])
+        try:
+            return self.kinds[key]
+        except KeyError:
+            visibility = self.kinds[key] = self._classify(header)
+            return visibility
+
+    def category(self, header):
+        """
+            Turn the share status into a category. Returns the category
+            and a list of (level, text) log messages, the category is None
+            if the post is excluded by the import filters.
+        """
+        key = (header["vis"], header["vis_href"], header["vis_text"])
+        try:
+            return self.categories[key], []
+        except KeyError:
+            pass
+        category, messages = self._category(header, self.classify(header))
+        # the messages of excluded posts name the post
+        if category is not None:
+            self.categories[key] = category
+        return category, messages
+
+    def _classify(self, header):
+        vis = header["vis"].rstrip()
+        match = self.general(vis)
+        if match:
+            return self.general_kinds[match.lastindex - 1], vis.split(",")[0]
+        kind = self.named.get(vis)
+        if kind is None:
+            href = header["vis_href"]
+            if href is None or "circles" not in href:
+                return Visibility.OTHER, vis
+            kind = Visibility.CIRCLE
+        return kind, self.classify_link(header)[1]
+
+    def classify_link(self, header):
+        """
+            Kind of the share status link and its label: the name of the
+            community, collection, circle or event. Only the link is used,
+            so this works before the "shared" section fits the language
+            of the dump. The kind is None for links to profiles, both are
+            None without a link.
+        """
+        href = header["vis_href"]
+        if href is None:
+            return None, None
+        for part, kind, deleted in LINK_KINDS:
+            if part in href:
+                return kind, header["vis_text"] or deleted
+        return None, header["vis_text"] or "Deleted profile"
+
+    def _category(self, header, visibility):
+        kind, label = visibility
+        if kind in VISIBILITY_GENERAL:
+            return label, []
+        if kind is Visibility.OTHER:
+            if self.private:
+                return self.other, []
+            return None, [("warning", "Private post will be ignored: {}".format(post_link(header)))]
+        if kind is Visibility.CIRCLE:
+            if not self.private:
+                return None, [("warning", "Private post will be ignored: {}".format(post_link(header)))]
+            if label in self.circle_filter:
+                return None, [("warning", "Post to circle \"{}\" will be ignored: {}".format(
+                    label, post_link(header)))]
+            return "Shared to circle \"{}\"".format(label), []
+        if kind is Visibility.COMMUNITY:
+            if not self.com:
+                return None, [("warning", "Community post will be ignored: {}".format(post_link(header)))]
+            if label in self.com_filter:
+                return None, [("warning", "Community post to \"{}\" will be ignored: {}".format(
+                    label, post_link(header)))]
+        elif kind is Visibility.EVENT and not self.event:
+            return None, [("warning", "Post to event will be ignored: {}".format(post_link(header)))]
+        # collections are considered to be public
+        return "{} \"{}\"".format(header["vis"].rstrip(), label), []
+
+
+def post_link(header):
+    """Link to the original post, empty if the share status links to something deleted."""
+    if header["vis_href"] is not None and not header["vis_text"]:
+        # original post 404
+        return ""
+    return header["link"]
+
+
+def _strings(value):
+    """A status of the configuration as a tuple of strings."""
+    if value is None:
+        return ()
+    if isinstance(value, str):
+        return (value,)
+    return tuple(value)
+
+
+class PostRecord(object):
+    """
+        All a post is rendered from: the header fields, the tags and
+        media links and the regions of the content as markup together
+        with the +1 and comment counts. Fields not passed are None, the
+        records of excluded posts only have the header fields.
+    """
+
+    __slots__ = HEADER_FIELDS + ("tags", "media", "body", "link_embed", "album",
+                                 "media_link", "visibility", "plusses", "activity",
+                                 "comment_count", "comments")
+
+    def __init__(self, **fields):
+        for field in self.__slots__:
+            setattr(self, field, fields.pop(field, None))
+        if fields:
+            raise TypeError("Unknown post record fields: {}".format(", ".join(sorted(fields))))
+
+    def to_dict(self):
+        return {field: getattr(self, field) for field in self.__slots__}
+
+
+class JsonlRef(object):
+    """
+        A post in a JSONL file written by --to-jsonl: the offset of its
+        line and the hash of the source file it was extracted from. Used
+        as a source like a path or an archive member.
+    """
+
+    __slots__ = ("filename", "offset", "digest", "name", "size")
+
+    def __init__(self, filename, offset, digest, name, size=None):
+        self.filename = filename
+        self.offset = offset
+        self.digest = digest
+        self.name = name
+        self.size = size
+
+
+def jsonl_index(filename):
+    """Map the post names of a JSONL file to references to their lines."""
+    filename = os.path.abspath(filename)
+    index = {}
+    offset = 0
+    with open(filename, "rb") as f:
+        for line in f:
+            if line.strip():
+                data = json.loads(line.decode("utf-8"))
+                name = data["record"]["name"]
+                index[name] = JsonlRef(filename, offset, data["hash"], name, data.get("size"))
+            offset += len(line)
+    return index
+
+
+def read_jsonl(ref):
+    """Read the post record and extraction messages of a JSONL line."""
+    with open(ref.filename, "rb") as f:
+        f.seek(ref.offset)
+        data = json.loads(f.readline().decode("utf-8"))
+    return PostRecord(**data["record"]), data["messages"]
+
+# classes of the post regions that make up the imported content, mapped
+# to their tag names
+CONTENT_REGIONS = {"main-content": "div",
+                   "link-embed": "a",
+                   "album": "div",
+                   "video-placeholder": "div",
+                   "visibility": "div",
+                   "post-activity": "div",
+                   "comments": "div",
+                   }
+
+DATE_RE = re.compile(r"^\d{4}(-\d{2}(-\d{2})?)?$")
+TAG_RE = re.compile(r"<(/?)(div|a)\b([^>]*)>", re.IGNORECASE)
+CLASS_RE = re.compile(r"""\bclass\s*=\s*(["']?)([^"'>]*)\1""", re.IGNORECASE)
+HREF_RE = re.compile(r"""\bhref\s*=\s*(["']?)([^"'>]*)\1""", re.IGNORECASE)
+LINK_RE = re.compile(r"""(<a\b[^>]*?\bhref\s*=\s*)(["'])(.*?)\2""", re.IGNORECASE | re.DOTALL)
+# path of a G+ post, optionally of another account (/u/1/) or a page (/b/…/)
+POST_PATH_RE = re.compile(r"^(?:/u/\d+)?(?:/b/\d+)?/[^/]+/posts/([^/]+)/?$")
+# local links to other posts, resolved by Nikola on every page the post
+# is shown
+LINK_FORMAT = "link://slug/{}"
+
+
+class HeaderComplete(Exception):
+    pass
+
+
+class HeaderScanner(html.parser.HTMLParser):
+    """
+        Collect the post header (title, author, date link and visibility)
+        without building a tree. Stops as soon as the visibility div is
+        closed. Values are the same BeautifulSoup would return for the
+        respective elements.
+    """
+
+    def __init__(self):
+        super(HeaderScanner, self).__init__(convert_charrefs=True)
+        self.header = {"title": None,
+                       "author": None,
+                       "profile": None,
+                       "date": None,
+                       "link": None,
+                       "vis": None,
+                       "vis_href": None,
+                       "vis_text": None,
+                       }
+        self._links = 0
+        self._title = None
+        self._captures = []
+        self._vis_depth = 0
+        self._vis_first = None
+        self._vis_link_first = None
+
+    def handle_starttag(self, tag, attrs):
+        if self._title is not None:
+            # title with markup has no .string
+            self._title.append(None)
+        self._end_first_child()
+        attrs = dict(attrs)
+        if tag == "title" and self.header["title"] is None and self._title is None:
+            self._title = []
+        elif tag == "a":
+            self._links += 1
+            classes = (attrs.get("class") or "").split()
+            if self._links == 1:
+                self.header["profile"] = attrs.get("href")
+            elif self._links == 2:
+                # post date is the 2nd link on the page
+                self.header["link"] = attrs.get("href")
+                self._captures.append(["date", 0, []])
+            if "author" in classes and self.header["author"] is None:
+                self._captures.append(["author", 0, []])
+            for capture in self._captures:
+                capture[1] += 1
+            if self._vis_depth and self.header["vis_href"] is None:
+                # 1st link of the visibility list is the com/coll/circle/event
+                self.header["vis_href"] = attrs.get("href") or ""
+                self._vis_link_first = []
+        elif tag == "div":
+            if self._vis_depth:
+                self._vis_depth += 1
+            elif self.header["vis"] is None and \
+                    "visibility" in (attrs.get("class") or "").split():
+                self._vis_depth = 1
+                self._vis_first = []
+
+    def handle_endtag(self, tag):
+        if tag == "title" and self._title is not None:
+            if len(self._title) == 1 and self._title[0] is not None:
+                self.header["title"] = self._title[0]
+            else:
+                self.header["title"] = "None"
+            self._title = None
+        self._end_first_child()
+        if tag == "a":
+            for capture in self._captures:
+                capture[1] -= 1
+                if not capture[1]:
+                    self.header[capture[0]] = "".join(capture[2])
+            self._captures = [c for c in self._captures if c[1]]
+        elif tag == "div" and self._vis_depth:
+            self._vis_depth -= 1
+            if not self._vis_depth:
+                if self.header["vis"] is None:
+                    self.header["vis"] = ""
+                if self._links >= 2 and self.header["title"] is not None:
+                    # stop parsing the rest of the fed chunk
+                    raise HeaderComplete()
+
+    def handle_data(self, data):
+        if self._title is not None:
+            if self._title and self._title[-1] is not None:
+                self._title[-1] += data
+            else:
+                self._title.append(data)
+        for capture in self._captures:
+            capture[2].append(data)
+        if self._vis_first is not None:
+            self._vis_first.append(data)
+        if self._vis_link_first is not None:
+            self._vis_link_first.append(data)
+
+    def _end_first_child(self):
+        # contents[0] of the visibility div and its link end with the
+        # next tag
+        if self._vis_first is not None:
+            self.header["vis"] = "".join(self._vis_first)
+            self._vis_first = None
+        if self._vis_link_first is not None:
+            self.header["vis_text"] = "".join(self._vis_link_first)
+            self._vis_link_first = None
+
+
+def scan_header(f, chunk_size=2048):
+    """Read the post file object until the header is complete."""
+    scanner = HeaderScanner()
+    try:
+        for chunk in iter(lambda: f.read(chunk_size), ""):
+            scanner.feed(chunk)
+        scanner.close()
+    except HeaderComplete:
+        pass
+    return scanner.header
+
+
+def locate_regions(text):
+    """
+        Find the content regions of a post in one pass over its div and a
+        tags. Returns a dict mapping region classes to the (start, end)
+        offsets of their first occurrence, the offsets of all media links
+        together with the regions enclosing them and the number of
+        comments.
+    """
+    regions = {}
+    media = []
+    comment_count = 0
+    depth = 0
+    # regions that are open at the current position: [class, depth, start]
+    current = []
+    for m in TAG_RE.finditer(text):
+        closing, name = m.group(1), m.group(2).lower()
+        classes = CLASS_RE.search(m.group(3))
+        classes = classes.group(2).split() if classes else ()
+        if name == "div":
+            if closing:
+                for region in [r for r in current if r[1] == depth]:
+                    regions[region[0]] = (region[2], m.end())
+                    current.remove(region)
+                depth -= 1
+                continue
+            depth += 1
+            if "comment" in classes and any(r[0] == "comments" for r in current):
+                comment_count += 1
+        elif closing:
+            for region in [r for r in current if r[1] is None]:
+                regions[region[0]] = (region[2], m.end())
+                current.remove(region)
+            continue
+        elif "media-link" in classes:
+            media.append((m.start(), [r[0] for r in current]))
+        for c in classes:
+            if CONTENT_REGIONS.get(c) == name and c not in regions and \
+                    not any(r[0] == c for r in current):
+                # links can't be nested so they end with the next </a>
+                current.append([c, depth if name == "div" else None, m.start()])
+    return regions, media, comment_count
+
+
+def read_header(src):
+    """
+        Read the header of a post file. The result is enough to classify
+        the post without parsing the whole file.
+    """
+    if isinstance(src, JsonlRef):
+        post, _ = read_jsonl(src)
+        return {k: getattr(post, k) for k in HEADER_FIELDS}
+    with open_source(src) as f:
+        header = scan_header(f)
+    header["name"] = source_name(src)
+    return header
+
+
+def scan_post(src):
+    """
+        Read what --statuses reports of a post: the header, the size of
+        the file and the number of media files the post links to. Only
+        the header is parsed, the media links are found by the tag scan
+        of locate_regions.
+    """
+    if isinstance(src, JsonlRef):
+        post, _ = read_jsonl(src)
+        return {k: getattr(post, k) for k in HEADER_FIELDS}, source_size(src), len(post.media or ())
+    with open_source(src) as f:
+        text = f.read()
+    header = scan_header(io.StringIO(text))
+    header["name"] = source_name(src)
+    media = 0
+    for start, _ in locate_regions(text)[1]:
+        href = HREF_RE.search(TAG_RE.match(text, start).group(3))
+        # external links are not copied
+        if href and not href.group(2).startswith("http"):
+            media += 1
+    return header, source_size(src), media
+
+
+def _fragment(text, span, name, parser):
+    """Parse a single region of the post into a tag."""
+    import bs4
+    return bs4.BeautifulSoup(text[span[0]:span[1]], parser).find(name)
+
+
+def extract_post(src, parser="html.parser"):
+    """
+        Extract all fields of a post into a post record. The header is
+        read by the HeaderScanner, the regions are located in a single
+        pass and only the ones that have to be modified or inspected are
+        parsed with BeautifulSoup, all others are passed through as they
+        are. Returns the post record and a list of (level, text) log
+        messages.
+
+        This runs in worker processes when importing with --jobs so it
+        only takes and returns picklable objects.
+    """
+    if isinstance(src, JsonlRef):
+        return read_jsonl(src)
+    import bs4
+    messages = []
+    with open_source(src) as f:
+        text = f.read()
+    post = scan_header(io.StringIO(text))
+    post["name"] = source_name(src)
+
+    try:
+        bs4.BeautifulSoup("", parser)
+    except bs4.FeatureNotFound:
+        parser = "html.parser"
+
+    spans, media_spans, comment_count = locate_regions(text)
+    regions = {}
+    # regions with media links are parsed so the links can be rewritten,
+    # the activity is parsed to count the plusses
+    parse = {r for _, enclosing in media_spans for r in enclosing} | {"post-activity"}
+    for region, span in spans.items():
+        if region in parse:
+            regions[region] = _fragment(text, span, CONTENT_REGIONS[region], parser)
+        else:
+            regions[region] = text[span[0]:span[1]]
+    for region in CONTENT_REGIONS:
+        regions.setdefault(region, None)
+
+    # links in parsed regions in document order, others parsed one by one
+    media_link = []
+    found = {}
+    for start, enclosing in media_spans:
+        for region in enclosing:
+            if isinstance(regions[region], bs4.Tag):
+                if region not in found:
+                    found[region] = iter(regions[region].find_all("a", "media-link"))
+                media_link.append(next(found[region]))
+                break
+        else:
+            end = text.find("</a>", start)
+            media_link.append(_fragment(text, (start, end + 4 if end >= 0 else len(text)), "a", parser))
+
+    tags = []
+    if regions["video-placeholder"] is not None:
+        tags.append("video")
+
+    media = []
+    for link in media_link:
+        # link to image in image folder if not external link
+        if not link["href"].startswith("http"):
+            filename = link["href"]
+            media.append(filename)
+            if "=" in filename:
+                filename = filename.replace("=", "--")
+            try:
+                link["href"] = os.path.join("..", "..", "images", filename)
+                tags.append("photo")
+            except TypeError:
+                messages.append(("warning", "No href attribute to convert link destination ({})".format(link)))
+            try:
+                link.img["src"] = os.path.join("..", "..", "images", filename)
+            except TypeError:
+                messages.append(("warning", "No src attribute to convert link destination ({})".format(link)))
+        # throw away redundant p tag filled with the post text
+        try:
+            link.p.decompose()
+        except AttributeError:
+            pass
+
+    # multiple entries only in albums, so we only need first item
+    try:
+        media_link = media_link[0]
+    except IndexError:
+        media_link = None
+
+    if regions["album"] is not None:
+        tags.append("photo_album")
+        # we don't need media_link if album is available
+        media_link = None
+
+    if regions["link-embed"] is not None:
+        tags.append("link")
+        # we don't need media_link if we got external link
+        media_link = None
+
+    activity = regions["post-activity"]
+    plusses = None
+    if activity is not None:
+        plusses = len(activity.find_all("a"))
+        activity = str(activity).replace("+1'd by: ", "")
+
+    def markup(part):
+        return None if part is None else str(part)
+
+    return PostRecord(tags=tags,
+                      media=media,
+                      body=markup(regions["main-content"]),
+                      link_embed=markup(regions["link-embed"]),
+                      album=markup(regions["album"]),
+                      media_link=markup(media_link),
+                      visibility=markup(regions["visibility"]),
+                      plusses=plusses,
+                      activity=activity,
+                      comment_count=comment_count if regions["comments"] is not None else None,
+                      comments=markup(regions["comments"]),
+                      **post), messages
+
+
+def html_bytes(content, rewrite_html=True, header=None):
+    """The post content as basic_import's write_content writes it."""
+    from lxml import etree, html as lxml_html
+    from nikola.plugins.basic_import import replacer
+    if rewrite_html:
+        try:
+            doc = lxml_html.document_fromstring(content)
+            doc.rewrite_links(replacer)
+            data = lxml_html.tostring(doc, encoding="utf8")
+        except etree.ParserError:
+            data = content.encode("utf-8")
+    else:
+        data = content.encode("utf-8")
+    if header:
+        data = header.encode("utf-8") + data
+    return data
+
+
+def image_link(name):
+    """
+        The quoted link to a file of the image folder as it appears in the
+        post files, lxml escapes href and src values when writing them.
+    """
+    path = posixpath.join("..", "..", "images", name)
+    data = html_bytes('<a href="{}"></a>'.format(html.escape(path)))
+    return re.search(rb"""href=("[^"]*"|'[^']*')""", data).group(1).decode("utf-8")
+
+
+def render_post(post):
+    """Assemble the post content from the extracted regions."""
+    # show plusses and comments as h3 headline if there are any
+    plus_header = None
+    if post.plusses is not None:
+        plus_header = "<h3>{} «+1»</h3>".format(post.plusses)
+    comment_header = None
+    if post.comment_count == 1:
+        comment_header = "<h3>One comment:</h3>"
+    elif post.comment_count is not None:
+        comment_header = "<h3>{} comments</h3>".format(post.comment_count)
+
+    parts = [post.body,
+             post.link_embed,
+             post.album,
+             post.media_link,
+             post.visibility,
+             plus_header,
+             post.activity,
+             comment_header,
+             post.comments]
+    return "".join("\n{}\n".format(part) for part in parts if part is not None)
+
+
+def post_slug(title, date):
+    """Title and slug of a post as derived from its header."""
+    title = CommandImportGplus.prettify_title(title)
+    return title, utils.slugify("{}_{}".format(date.split()[0], title), lang="de")
+
+
+def post_key(url):
+    """
+        Key of a link to a G+ post in the URL index, None for all other
+        links. The key is the post id, the account part of the URL is
+        either the numeric id or the +name.
+    """
+    if not url:
+        return None
+    parts = urllib.parse.urlsplit(url)
+    if parts.netloc.lower() != "plus.google.com":
+        return None
+    match = POST_PATH_RE.match(parts.path)
+    return match.group(1) if match else None
+
+
+def link_posts(content, urls):
+    """
+        Let the links to posts in the urls index (keys to slugs) point to
+        the imported posts. Returns the content and the keys of all links
+        to posts mapped to their slug or None if the post isn't imported.
+    """
+    refs = {}
+
+    def replace(match):
+        key = post_key(html.unescape(match.group(3)))
+        if key is None:
+            return match.group(0)
+        refs[key] = urls.get(key)
+        if refs[key] is None:
+            return match.group(0)
+        return "{0}{1}{2}{1}".format(match.group(1), match.group(2), LINK_FORMAT.format(refs[key]))
+
+    return LINK_RE.sub(replace, content), refs
+
+
+def convert_post(post, extract_messages, classifier, timings=None, urls=None):
+    """
+        Classify and render an extracted post. Log messages are collected
+        as (level, text) tuples and emitted by the caller. The category
+        (and everything but the header) is None if the post is excluded
+        by the import filters. The seconds spent classifying and rendering
+        are stored in timings if a dict is passed. Links to the posts in
+        urls (see link_posts) are rewritten.
+    """
+    timings = {} if timings is None else timings
+    start = time.perf_counter()
+    name = post.name
+    header = {k: getattr(post, k) for k in CLASSIFY_FIELDS}
+    cat, messages = classifier.category(header)
+    timings["classify"] = time.perf_counter() - start
+    if cat is None:
+        return messages, ConvertedPost(name, header, None, None, None, None, None, None, [], {})
+    messages.extend(extract_messages)
+
+    start = time.perf_counter()
+    title, slug = post_slug(post.title, post.date)
+    content = render_post(post)
+    refs = {}
+    if urls is not None:
+        content, refs = link_posts(content, urls)
+    timings["render"] = time.perf_counter() - start
+
+    return messages, ConvertedPost(name,
+                                   header,
+                                   slug,
+                                   title,
+                                   post.date,
+                                   sorted(set(post.tags)),
+                                   cat,
+                                   content,
+                                   post.media,
+                                   refs,
+                                   )